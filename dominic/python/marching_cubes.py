@@ -1,98 +1,274 @@
-import math, trimesh, time
-
-surfaceLevel = 0.5
-
-res = 128
-
-triTable = [[], [0, 8, 3], [0, 1, 9], [1, 8, 3, 9, 8, 1], [1, 2, 10], [0, 8, 3, 1, 2, 10], [9, 2, 10, 0, 2, 9], [2, 8, 3, 2, 10, 8, 10, 9, 8], [3, 11, 2], [0, 11, 2, 8, 11, 0], [1, 9, 0, 2, 3, 11], [1, 11, 2, 1, 9, 11, 9, 8, 11], [3, 10, 1, 11, 10, 3], [0, 10, 1, 0, 8, 10, 8, 11, 10], [3, 9, 0, 3, 11, 9, 11, 10, 9], [9, 8, 10, 10, 8, 11], [4, 7, 8], [4, 3, 0, 7, 3, 4], [0, 1, 9, 8, 4, 7], [4, 1, 9, 4, 7, 1, 7, 3, 1], [1, 2, 10, 8, 4, 7], [3, 4, 7, 3, 0, 4, 1, 2, 10], [9, 2, 10, 9, 0, 2, 8, 4, 7], [2, 10, 9, 2, 9, 7, 2, 7, 3, 7, 9, 4], [8, 4, 7, 3, 11, 2], [11, 4, 7, 11, 2, 4, 2, 0, 4], [9, 0, 1, 8, 4, 7, 2, 3, 11], [4, 7, 11, 9, 4, 11, 9, 11, 2, 9, 2, 1], [3, 10, 1, 3, 11, 10, 7, 8, 4], [1, 11, 10, 1, 4, 11, 1, 0, 4, 7, 11, 4], [4, 7, 8, 9, 0, 11, 9, 11, 10, 11, 0, 3], [4, 7, 11, 4, 11, 9, 9, 11, 10], [9, 5, 4], [9, 5, 4, 0, 8, 3], [0, 5, 4, 1, 5, 0], [8, 5, 4, 8, 3, 5, 3, 1, 5], [1, 2, 10, 9, 5, 4], [3, 0, 8, 1, 2, 10, 4, 9, 5], [5, 2, 10, 5, 4, 2, 4, 0, 2], [2, 10, 5, 3, 2, 5, 3, 5, 4, 3, 4, 8], [9, 5, 4, 2, 3, 11], [0, 11, 2, 0, 8, 11, 4, 9, 5], [0, 5, 4, 0, 1, 5, 2, 3, 11], [2, 1, 5, 2, 5, 8, 2, 8, 11, 4, 8, 5], [10, 3, 11, 10, 1, 3, 9, 5, 4], [4, 9, 5, 0, 8, 1, 8, 10, 1, 8, 11, 10], [5, 4, 0, 5, 0, 11, 5, 11, 10, 11, 0, 3], [5, 4, 8, 5, 8, 10, 10, 8, 11], [9, 7, 8, 5, 7, 9], [9, 3, 0, 9, 5, 3, 5, 7, 3], [0, 7, 8, 0, 1, 7, 1, 5, 7], [1, 5, 3, 3, 5, 7], [9, 7, 8, 9, 5, 7, 10, 1, 2], [10, 1, 2, 9, 5, 0, 5, 3, 0, 5, 7, 3], [8, 0, 2, 8, 2, 5, 8, 5, 7, 10, 5, 2], [2, 10, 5, 2, 5, 3, 3, 5, 7], [7, 9, 5, 7, 8, 9, 3, 11, 2], [9, 5, 7, 9, 7, 2, 9, 2, 0, 2, 7, 11], [2, 3, 11, 0, 1, 8, 1, 7, 8, 1, 5, 7], [11, 2, 1, 11, 1, 7, 7, 1, 5], [9, 5, 8, 8, 5, 7, 10, 1, 3, 10, 3, 11], [5, 7, 0, 5, 0, 9, 7, 11, 0, 1, 0, 10, 11, 10, 0], [11, 10, 0, 11, 0, 3, 10, 5, 0, 8, 0, 7, 5, 7, 0], [11, 10, 5, 7, 11, 5], [10, 6, 5], [0, 8, 3, 5, 10, 6], [9, 0, 1, 5, 10, 6], [1, 8, 3, 1, 9, 8, 5, 10, 6], [1, 6, 5, 2, 6, 1], [1, 6, 5, 1, 2, 6, 3, 0, 8], [9, 6, 5, 9, 0, 6, 0, 2, 6], [5, 9, 8, 5, 8, 2, 5, 2, 6, 3, 2, 8], [2, 3, 11, 10, 6, 5], [11, 0, 8, 11, 2, 0, 10, 6, 5], [0, 1, 9, 2, 3, 11, 5, 10, 6], [5, 10, 6, 1, 9, 2, 9, 11, 2, 9, 8, 11], [6, 3, 11, 6, 5, 3, 5, 1, 3], [0, 8, 11, 0, 11, 5, 0, 5, 1, 5, 11, 6], [3, 11, 6, 0, 3, 6, 0, 6, 5, 0, 5, 9], [6, 5, 9, 6, 9, 11, 11, 9, 8], [5, 10, 6, 4, 7, 8], [4, 3, 0, 4, 7, 3, 6, 5, 10], [1, 9, 0, 5, 10, 6, 8, 4, 7], [10, 6, 5, 1, 9, 7, 1, 7, 3, 7, 9, 4], [6, 1, 2, 6, 5, 1, 4, 7, 8], [1, 2, 5, 5, 2, 6, 3, 0, 4, 3, 4, 7], [8, 4, 7, 9, 0, 5, 0, 6, 5, 0, 2, 6], [7, 3, 9, 7, 9, 4, 3, 2, 9, 5, 9, 6, 2, 6, 9], [3, 11, 2, 7, 8, 4, 10, 6, 5], [5, 10, 6, 4, 7, 2, 4, 2, 0, 2, 7, 11], [0, 1, 9, 4, 7, 8, 2, 3, 11, 5, 10, 6], [9, 2, 1, 9, 11, 2, 9, 4, 11, 7, 11, 4, 5, 10, 6], [8, 4, 7, 3, 11, 5, 3, 5, 1, 5, 11, 6], [5, 1, 11, 5, 11, 6, 1, 0, 11, 7, 11, 4, 0, 4, 11], [0, 5, 9, 0, 6, 5, 0, 3, 6, 11, 6, 3, 8, 4, 7], [6, 5, 9, 6, 9, 11, 4, 7, 9, 7, 11, 9], [10, 4, 9, 6, 4, 10], [4, 10, 6, 4, 9, 10, 0, 8, 3], [10, 0, 1, 10, 6, 0, 6, 4, 0], [8, 3, 1, 8, 1, 6, 8, 6, 4, 6, 1, 10], [1, 4, 9, 1, 2, 4, 2, 6, 4], [3, 0, 8, 1, 2, 9, 2, 4, 9, 2, 6, 4], [0, 2, 4, 4, 2, 6], [8, 3, 2, 8, 2, 4, 4, 2, 6], [10, 4, 9, 10, 6, 4, 11, 2, 3], [0, 8, 2, 2, 8, 11, 4, 9, 10, 4, 10, 6], [3, 11, 2, 0, 1, 6, 0, 6, 4, 6, 1, 10], [6, 4, 1, 6, 1, 10, 4, 8, 1, 2, 1, 11, 8, 11, 1], [9, 6, 4, 9, 3, 6, 9, 1, 3, 11, 6, 3], [8, 11, 1, 8, 1, 0, 11, 6, 1, 9, 1, 4, 6, 4, 1], [3, 11, 6, 3, 6, 0, 0, 6, 4], [6, 4, 8, 11, 6, 8], [7, 10, 6, 7, 8, 10, 8, 9, 10], [0, 7, 3, 0, 10, 7, 0, 9, 10, 6, 7, 10], [10, 6, 7, 1, 10, 7, 1, 7, 8, 1, 8, 0], [10, 6, 7, 10, 7, 1, 1, 7, 3], [1, 2, 6, 1, 6, 8, 1, 8, 9, 8, 6, 7], [2, 6, 9, 2, 9, 1, 6, 7, 9, 0, 9, 3, 7, 3, 9], [7, 8, 0, 7, 0, 6, 6, 0, 2], [7, 3, 2, 6, 7, 2], [2, 3, 11, 10, 6, 8, 10, 8, 9, 8, 6, 7], [2, 0, 7, 2, 7, 11, 0, 9, 7, 6, 7, 10, 9, 10, 7], [1, 8, 0, 1, 7, 8, 1, 10, 7, 6, 7, 10, 2, 3, 11], [11, 2, 1, 11, 1, 7, 10, 6, 1, 6, 7, 1], [8, 9, 6, 8, 6, 7, 9, 1, 6, 11, 6, 3, 1, 3, 6], [0, 9, 1, 11, 6, 7], [7, 8, 0, 7, 0, 6, 3, 11, 0, 11, 6, 0], [7, 11, 6], [7, 6, 11], [3, 0, 8, 11, 7, 6], [0, 1, 9, 11, 7, 6], [8, 1, 9, 8, 3, 1, 11, 7, 6], [10, 1, 2, 6, 11, 7], [1, 2, 10, 3, 0, 8, 6, 11, 7], [2, 9, 0, 2, 10, 9, 6, 11, 7], [6, 11, 7, 2, 10, 3, 10, 8, 3, 10, 9, 8], [7, 2, 3, 6, 2, 7], [7, 0, 8, 7, 6, 0, 6, 2, 0], [2, 7, 6, 2, 3, 7, 0, 1, 9], [1, 6, 2, 1, 8, 6, 1, 9, 8, 8, 7, 6], [10, 7, 6, 10, 1, 7, 1, 3, 7], [10, 7, 6, 1, 7, 10, 1, 8, 7, 1, 0, 8], [0, 3, 7, 0, 7, 10, 0, 10, 9, 6, 10, 7], [7, 6, 10, 7, 10, 8, 8, 10, 9], [6, 8, 4, 11, 8, 6], [3, 6, 11, 3, 0, 6, 0, 4, 6], [8, 6, 11, 8, 4, 6, 9, 0, 1], [9, 4, 6, 9, 6, 3, 9, 3, 1, 11, 3, 6], [6, 8, 4, 6, 11, 8, 2, 10, 1], [1, 2, 10, 3, 0, 11, 0, 6, 11, 0, 4, 6], [4, 11, 8, 4, 6, 11, 0, 2, 9, 2, 10, 9], [10, 9, 3, 10, 3, 2, 9, 4, 3, 11, 3, 6, 4, 6, 3], [8, 2, 3, 8, 4, 2, 4, 6, 2], [0, 4, 2, 4, 6, 2], [1, 9, 0, 2, 3, 4, 2, 4, 6, 4, 3, 8], [1, 9, 4, 1, 4, 2, 2, 4, 6], [8, 1, 3, 8, 6, 1, 8, 4, 6, 6, 10, 1], [10, 1, 0, 10, 0, 6, 6, 0, 4], [4, 6, 3, 4, 3, 8, 6, 10, 3, 0, 3, 9, 10, 9, 3], [10, 9, 4, 6, 10, 4], [4, 9, 5, 7, 6, 11], [0, 8, 3, 4, 9, 5, 11, 7, 6], [5, 0, 1, 5, 4, 0, 7, 6, 11], [11, 7, 6, 8, 3, 4, 3, 5, 4, 3, 1, 5], [9, 5, 4, 10, 1, 2, 7, 6, 11], [6, 11, 7, 1, 2, 10, 0, 8, 3, 4, 9, 5], [7, 6, 11, 5, 4, 10, 4, 2, 10, 4, 0, 2], [3, 4, 8, 3, 5, 4, 3, 2, 5, 10, 5, 2, 11, 7, 6], [7, 2, 3, 7, 6, 2, 5, 4, 9], [9, 5, 4, 0, 8, 6, 0, 6, 2, 6, 8, 7], [3, 6, 2, 3, 7, 6, 1, 5, 0, 5, 4, 0], [6, 2, 8, 6, 8, 7, 2, 1, 8, 4, 8, 5, 1, 5, 8], [9, 5, 4, 10, 1, 6, 1, 7, 6, 1, 3, 7], [1, 6, 10, 1, 7, 6, 1, 0, 7, 8, 7, 0, 9, 5, 4], [4, 0, 10, 4, 10, 5, 0, 3, 10, 6, 10, 7, 3, 7, 10], [7, 6, 10, 7, 10, 8, 5, 4, 10, 4, 8, 10], [6, 9, 5, 6, 11, 9, 11, 8, 9], [3, 6, 11, 0, 6, 3, 0, 5, 6, 0, 9, 5], [0, 11, 8, 0, 5, 11, 0, 1, 5, 5, 6, 11], [6, 11, 3, 6, 3, 5, 5, 3, 1], [1, 2, 10, 9, 5, 11, 9, 11, 8, 11, 5, 6], [0, 11, 3, 0, 6, 11, 0, 9, 6, 5, 6, 9, 1, 2, 10], [11, 8, 5, 11, 5, 6, 8, 0, 5, 10, 5, 2, 0, 2, 5], [6, 11, 3, 6, 3, 5, 2, 10, 3, 10, 5, 3], [5, 8, 9, 5, 2, 8, 5, 6, 2, 3, 8, 2], [9, 5, 6, 9, 6, 0, 0, 6, 2], [1, 5, 8, 1, 8, 0, 5, 6, 8, 3, 8, 2, 6, 2, 8], [1, 5, 6, 2, 1, 6], [1, 3, 6, 1, 6, 10, 3, 8, 6, 5, 6, 9, 8, 9, 6], [10, 1, 0, 10, 0, 6, 9, 5, 0, 5, 6, 0], [0, 3, 8, 5, 6, 10], [10, 5, 6], [11, 5, 10, 7, 5, 11], [11, 5, 10, 11, 7, 5, 8, 3, 0], [5, 11, 7, 5, 10, 11, 1, 9, 0], [10, 7, 5, 10, 11, 7, 9, 8, 1, 8, 3, 1], [11, 1, 2, 11, 7, 1, 7, 5, 1], [0, 8, 3, 1, 2, 7, 1, 7, 5, 7, 2, 11], [9, 7, 5, 9, 2, 7, 9, 0, 2, 2, 11, 7], [7, 5, 2, 7, 2, 11, 5, 9, 2, 3, 2, 8, 9, 8, 2], [2, 5, 10, 2, 3, 5, 3, 7, 5], [8, 2, 0, 8, 5, 2, 8, 7, 5, 10, 2, 5], [9, 0, 1, 5, 10, 3, 5, 3, 7, 3, 10, 2], [9, 8, 2, 9, 2, 1, 8, 7, 2, 10, 2, 5, 7, 5, 2], [1, 3, 5, 3, 7, 5], [0, 8, 7, 0, 7, 1, 1, 7, 5], [9, 0, 3, 9, 3, 5, 5, 3, 7], [9, 8, 7, 5, 9, 7], [5, 8, 4, 5, 10, 8, 10, 11, 8], [5, 0, 4, 5, 11, 0, 5, 10, 11, 11, 3, 0], [0, 1, 9, 8, 4, 10, 8, 10, 11, 10, 4, 5], [10, 11, 4, 10, 4, 5, 11, 3, 4, 9, 4, 1, 3, 1, 4], [2, 5, 1, 2, 8, 5, 2, 11, 8, 4, 5, 8], [0, 4, 11, 0, 11, 3, 4, 5, 11, 2, 11, 1, 5, 1, 11], [0, 2, 5, 0, 5, 9, 2, 11, 5, 4, 5, 8, 11, 8, 5], [9, 4, 5, 2, 11, 3], [2, 5, 10, 3, 5, 2, 3, 4, 5, 3, 8, 4], [5, 10, 2, 5, 2, 4, 4, 2, 0], [3, 10, 2, 3, 5, 10, 3, 8, 5, 4, 5, 8, 0, 1, 9], [5, 10, 2, 5, 2, 4, 1, 9, 2, 9, 4, 2], [8, 4, 5, 8, 5, 3, 3, 5, 1], [0, 4, 5, 1, 0, 5], [8, 4, 5, 8, 5, 3, 9, 0, 5, 0, 3, 5], [9, 4, 5], [4, 11, 7, 4, 9, 11, 9, 10, 11], [0, 8, 3, 4, 9, 7, 9, 11, 7, 9, 10, 11], [1, 10, 11, 1, 11, 4, 1, 4, 0, 7, 4, 11], [3, 1, 4, 3, 4, 8, 1, 10, 4, 7, 4, 11, 10, 11, 4], [4, 11, 7, 9, 11, 4, 9, 2, 11, 9, 1, 2], [9, 7, 4, 9, 11, 7, 9, 1, 11, 2, 11, 1, 0, 8, 3], [11, 7, 4, 11, 4, 2, 2, 4, 0], [11, 7, 4, 11, 4, 2, 8, 3, 4, 3, 2, 4], [2, 9, 10, 2, 7, 9, 2, 3, 7, 7, 4, 9], [9, 10, 7, 9, 7, 4, 10, 2, 7, 8, 7, 0, 2, 0, 7], [3, 7, 10, 3, 10, 2, 7, 4, 10, 1, 10, 0, 4, 0, 10], [1, 10, 2, 8, 7, 4], [4, 9, 1, 4, 1, 7, 7, 1, 3], [4, 9, 1, 4, 1, 7, 0, 8, 1, 8, 7, 1], [4, 0, 3, 7, 4, 3], [4, 8, 7], [9, 10, 8, 10, 11, 8], [3, 0, 9, 3, 9, 11, 11, 9, 10], [0, 1, 10, 0, 10, 8, 8, 10, 11], [3, 1, 10, 11, 3, 10], [1, 2, 11, 1, 11, 9, 9, 11, 8], [3, 0, 9, 3, 9, 11, 1, 2, 9, 2, 11, 9], [0, 2, 11, 8, 0, 11], [3, 2, 11], [2, 3, 8, 2, 8, 10, 10, 8, 9], [9, 10, 2, 0, 9, 2], [2, 3, 8, 2, 8, 10, 0, 1, 8, 1, 10, 8], [1, 10, 2], [1, 3, 8, 9, 1, 8], [0, 9, 1], [0, 3, 8], []]
-cornersFromEdge = [[0,1,2,3,4,5,6,7,0,1,2,3], [1,2,3,0,5,6,7,4,4,5,6,7]]
-
-tic = time.time()
-
-hashmap = dict()
-
-
-def sphere_func(x, y, z):
-    return 1 * math.sqrt((x - 0.5)**2 + (y - 0.5)**2 + (z - 0.5)**2)
-
-def hash(arr):
-    return (arr[0] * res * res) + (arr[1] * res) + arr[2]
-
-def evaluate(f, arr):
-    h = hash(arr)
-    if h in hashmap.keys():
-        return hashmap[h]
-    x = arr[0]
-    y = arr[1]
-    z = arr[2]
-    val = f(x, y, z)
-    hashmap[h] = val
-    return val
-
-def mean(v1, v2, interpolate = False, f = None):
-    weight1 = 1
-    weight2 = 1
-    if interpolate:
-        if f is None:
-            raise Exception("no function given")
-        weight2 = (surfaceLevel - evaluate(f, v1)) / (evaluate(f, v2) - evaluate(f, v1))
-        weight1 = 1 - weight2
-    result = [0, 0, 0]
-    for i in range(3):
-        result[i] = ((weight1 * v1[i]) + (weight2 * v2[i])) / (weight1 + weight2)
-    return result
-
-def march(f, x_min=0, x_max = 1, y_min=0, y_max=1, z_min=0, z_max=1):
-    #print(indicator_function(1, 0.5, 0.5))
-    dx = (x_max - x_min) / res
-    dy = (y_max - y_min) / res
-    dz = (z_max - z_min) / res
-
-    vertices = []
-    faces = []
-
-    for i in range(res):
-        x = x_min + (i * dx)
-        for j in range(res):
-            y = y_min + (j * dy)
-            for k in range(res):
-                z = z_min + (k * dz)
-                #corners = [[x, y, z], [x+dx, y, z], [x, y+dy, z], [x+dx, y+dy, z], [x, y, z+dz], [x+dx, y, z+dz], [x, y+dy, z+dz], [x+dz, y+dy, z+dz]]
-                corners = [[x, y, z], [x+dx, y, z], [x+dx, y, z+dz], [x, y, z+dz], [x, y+dy, z], [x+dx, y+dy, z], [x+dx, y+dy, z+dz], [x, y+dy, z+dz]]
-                cubeIndex = 0
-                for cornerNum in range(len(corners)):
-                    if evaluate(f, corners[cornerNum]) < surfaceLevel:
-                        cubeIndex |= 1 << cornerNum
-                trianglulation = triTable[cubeIndex]
-                if len(trianglulation) % 3 != 0:
-                    raise Exception("error in triangulation table")
-                for faceNum in range(len(trianglulation) // 3):
-                    prevNumVertices = len(vertices)
-                    for vertexNum in range(3):
-                        edgeIndex = trianglulation[(faceNum * 3) + vertexNum]
-                        indexA = cornersFromEdge[0][edgeIndex]
-                        indexB = cornersFromEdge[1][edgeIndex]
-                        vertex = mean(corners[indexA], corners[indexB], True, f)
-                        vertices.append(vertex)
-                    faces.append([prevNumVertices, prevNumVertices+1, prevNumVertices+2])
-    #print(vertices)
-    #print(faces)
-    mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
-    #trimesh.repair.fix_winding(mesh)
-    toc = time.time()
-    print(toc - tic)
-    mesh.show()
-
-
-
-
-
-
-def main():
-    #tic = time.time()
-    march(sphere_func)
-    #mesh = trimesh.Trimesh(vertices=[[0, 0, 0], [0, 0, 1], [0, 1, 0]], faces=[[0, 1, 2]])
-    #mesh.show()
-
-if __name__ == "__main__":
+import trimesh, time
+import numpy as np
+
+surfaceLevel = 0.5
+
+res = 128
+
+triTable = [[], [0, 8, 3], [0, 1, 9], [1, 8, 3, 9, 8, 1], [1, 2, 10], [0, 8, 3, 1, 2, 10], [9, 2, 10, 0, 2, 9], [2, 8, 3, 2, 10, 8, 10, 9, 8], [3, 11, 2], [0, 11, 2, 8, 11, 0], [1, 9, 0, 2, 3, 11], [1, 11, 2, 1, 9, 11, 9, 8, 11], [3, 10, 1, 11, 10, 3], [0, 10, 1, 0, 8, 10, 8, 11, 10], [3, 9, 0, 3, 11, 9, 11, 10, 9], [9, 8, 10, 10, 8, 11], [4, 7, 8], [4, 3, 0, 7, 3, 4], [0, 1, 9, 8, 4, 7], [4, 1, 9, 4, 7, 1, 7, 3, 1], [1, 2, 10, 8, 4, 7], [3, 4, 7, 3, 0, 4, 1, 2, 10], [9, 2, 10, 9, 0, 2, 8, 4, 7], [2, 10, 9, 2, 9, 7, 2, 7, 3, 7, 9, 4], [8, 4, 7, 3, 11, 2], [11, 4, 7, 11, 2, 4, 2, 0, 4], [9, 0, 1, 8, 4, 7, 2, 3, 11], [4, 7, 11, 9, 4, 11, 9, 11, 2, 9, 2, 1], [3, 10, 1, 3, 11, 10, 7, 8, 4], [1, 11, 10, 1, 4, 11, 1, 0, 4, 7, 11, 4], [4, 7, 8, 9, 0, 11, 9, 11, 10, 11, 0, 3], [4, 7, 11, 4, 11, 9, 9, 11, 10], [9, 5, 4], [9, 5, 4, 0, 8, 3], [0, 5, 4, 1, 5, 0], [8, 5, 4, 8, 3, 5, 3, 1, 5], [1, 2, 10, 9, 5, 4], [3, 0, 8, 1, 2, 10, 4, 9, 5], [5, 2, 10, 5, 4, 2, 4, 0, 2], [2, 10, 5, 3, 2, 5, 3, 5, 4, 3, 4, 8], [9, 5, 4, 2, 3, 11], [0, 11, 2, 0, 8, 11, 4, 9, 5], [0, 5, 4, 0, 1, 5, 2, 3, 11], [2, 1, 5, 2, 5, 8, 2, 8, 11, 4, 8, 5], [10, 3, 11, 10, 1, 3, 9, 5, 4], [4, 9, 5, 0, 8, 1, 8, 10, 1, 8, 11, 10], [5, 4, 0, 5, 0, 11, 5, 11, 10, 11, 0, 3], [5, 4, 8, 5, 8, 10, 10, 8, 11], [9, 7, 8, 5, 7, 9], [9, 3, 0, 9, 5, 3, 5, 7, 3], [0, 7, 8, 0, 1, 7, 1, 5, 7], [1, 5, 3, 3, 5, 7], [9, 7, 8, 9, 5, 7, 10, 1, 2], [10, 1, 2, 9, 5, 0, 5, 3, 0, 5, 7, 3], [8, 0, 2, 8, 2, 5, 8, 5, 7, 10, 5, 2], [2, 10, 5, 2, 5, 3, 3, 5, 7], [7, 9, 5, 7, 8, 9, 3, 11, 2], [9, 5, 7, 9, 7, 2, 9, 2, 0, 2, 7, 11], [2, 3, 11, 0, 1, 8, 1, 7, 8, 1, 5, 7], [11, 2, 1, 11, 1, 7, 7, 1, 5], [9, 5, 8, 8, 5, 7, 10, 1, 3, 10, 3, 11], [5, 7, 0, 5, 0, 9, 7, 11, 0, 1, 0, 10, 11, 10, 0], [11, 10, 0, 11, 0, 3, 10, 5, 0, 8, 0, 7, 5, 7, 0], [11, 10, 5, 7, 11, 5], [10, 6, 5], [0, 8, 3, 5, 10, 6], [9, 0, 1, 5, 10, 6], [1, 8, 3, 1, 9, 8, 5, 10, 6], [1, 6, 5, 2, 6, 1], [1, 6, 5, 1, 2, 6, 3, 0, 8], [9, 6, 5, 9, 0, 6, 0, 2, 6], [5, 9, 8, 5, 8, 2, 5, 2, 6, 3, 2, 8], [2, 3, 11, 10, 6, 5], [11, 0, 8, 11, 2, 0, 10, 6, 5], [0, 1, 9, 2, 3, 11, 5, 10, 6], [5, 10, 6, 1, 9, 2, 9, 11, 2, 9, 8, 11], [6, 3, 11, 6, 5, 3, 5, 1, 3], [0, 8, 11, 0, 11, 5, 0, 5, 1, 5, 11, 6], [3, 11, 6, 0, 3, 6, 0, 6, 5, 0, 5, 9], [6, 5, 9, 6, 9, 11, 11, 9, 8], [5, 10, 6, 4, 7, 8], [4, 3, 0, 4, 7, 3, 6, 5, 10], [1, 9, 0, 5, 10, 6, 8, 4, 7], [10, 6, 5, 1, 9, 7, 1, 7, 3, 7, 9, 4], [6, 1, 2, 6, 5, 1, 4, 7, 8], [1, 2, 5, 5, 2, 6, 3, 0, 4, 3, 4, 7], [8, 4, 7, 9, 0, 5, 0, 6, 5, 0, 2, 6], [7, 3, 9, 7, 9, 4, 3, 2, 9, 5, 9, 6, 2, 6, 9], [3, 11, 2, 7, 8, 4, 10, 6, 5], [5, 10, 6, 4, 7, 2, 4, 2, 0, 2, 7, 11], [0, 1, 9, 4, 7, 8, 2, 3, 11, 5, 10, 6], [9, 2, 1, 9, 11, 2, 9, 4, 11, 7, 11, 4, 5, 10, 6], [8, 4, 7, 3, 11, 5, 3, 5, 1, 5, 11, 6], [5, 1, 11, 5, 11, 6, 1, 0, 11, 7, 11, 4, 0, 4, 11], [0, 5, 9, 0, 6, 5, 0, 3, 6, 11, 6, 3, 8, 4, 7], [6, 5, 9, 6, 9, 11, 4, 7, 9, 7, 11, 9], [10, 4, 9, 6, 4, 10], [4, 10, 6, 4, 9, 10, 0, 8, 3], [10, 0, 1, 10, 6, 0, 6, 4, 0], [8, 3, 1, 8, 1, 6, 8, 6, 4, 6, 1, 10], [1, 4, 9, 1, 2, 4, 2, 6, 4], [3, 0, 8, 1, 2, 9, 2, 4, 9, 2, 6, 4], [0, 2, 4, 4, 2, 6], [8, 3, 2, 8, 2, 4, 4, 2, 6], [10, 4, 9, 10, 6, 4, 11, 2, 3], [0, 8, 2, 2, 8, 11, 4, 9, 10, 4, 10, 6], [3, 11, 2, 0, 1, 6, 0, 6, 4, 6, 1, 10], [6, 4, 1, 6, 1, 10, 4, 8, 1, 2, 1, 11, 8, 11, 1], [9, 6, 4, 9, 3, 6, 9, 1, 3, 11, 6, 3], [8, 11, 1, 8, 1, 0, 11, 6, 1, 9, 1, 4, 6, 4, 1], [3, 11, 6, 3, 6, 0, 0, 6, 4], [6, 4, 8, 11, 6, 8], [7, 10, 6, 7, 8, 10, 8, 9, 10], [0, 7, 3, 0, 10, 7, 0, 9, 10, 6, 7, 10], [10, 6, 7, 1, 10, 7, 1, 7, 8, 1, 8, 0], [10, 6, 7, 10, 7, 1, 1, 7, 3], [1, 2, 6, 1, 6, 8, 1, 8, 9, 8, 6, 7], [2, 6, 9, 2, 9, 1, 6, 7, 9, 0, 9, 3, 7, 3, 9], [7, 8, 0, 7, 0, 6, 6, 0, 2], [7, 3, 2, 6, 7, 2], [2, 3, 11, 10, 6, 8, 10, 8, 9, 8, 6, 7], [2, 0, 7, 2, 7, 11, 0, 9, 7, 6, 7, 10, 9, 10, 7], [1, 8, 0, 1, 7, 8, 1, 10, 7, 6, 7, 10, 2, 3, 11], [11, 2, 1, 11, 1, 7, 10, 6, 1, 6, 7, 1], [8, 9, 6, 8, 6, 7, 9, 1, 6, 11, 6, 3, 1, 3, 6], [0, 9, 1, 11, 6, 7], [7, 8, 0, 7, 0, 6, 3, 11, 0, 11, 6, 0], [7, 11, 6], [7, 6, 11], [3, 0, 8, 11, 7, 6], [0, 1, 9, 11, 7, 6], [8, 1, 9, 8, 3, 1, 11, 7, 6], [10, 1, 2, 6, 11, 7], [1, 2, 10, 3, 0, 8, 6, 11, 7], [2, 9, 0, 2, 10, 9, 6, 11, 7], [6, 11, 7, 2, 10, 3, 10, 8, 3, 10, 9, 8], [7, 2, 3, 6, 2, 7], [7, 0, 8, 7, 6, 0, 6, 2, 0], [2, 7, 6, 2, 3, 7, 0, 1, 9], [1, 6, 2, 1, 8, 6, 1, 9, 8, 8, 7, 6], [10, 7, 6, 10, 1, 7, 1, 3, 7], [10, 7, 6, 1, 7, 10, 1, 8, 7, 1, 0, 8], [0, 3, 7, 0, 7, 10, 0, 10, 9, 6, 10, 7], [7, 6, 10, 7, 10, 8, 8, 10, 9], [6, 8, 4, 11, 8, 6], [3, 6, 11, 3, 0, 6, 0, 4, 6], [8, 6, 11, 8, 4, 6, 9, 0, 1], [9, 4, 6, 9, 6, 3, 9, 3, 1, 11, 3, 6], [6, 8, 4, 6, 11, 8, 2, 10, 1], [1, 2, 10, 3, 0, 11, 0, 6, 11, 0, 4, 6], [4, 11, 8, 4, 6, 11, 0, 2, 9, 2, 10, 9], [10, 9, 3, 10, 3, 2, 9, 4, 3, 11, 3, 6, 4, 6, 3], [8, 2, 3, 8, 4, 2, 4, 6, 2], [0, 4, 2, 4, 6, 2], [1, 9, 0, 2, 3, 4, 2, 4, 6, 4, 3, 8], [1, 9, 4, 1, 4, 2, 2, 4, 6], [8, 1, 3, 8, 6, 1, 8, 4, 6, 6, 10, 1], [10, 1, 0, 10, 0, 6, 6, 0, 4], [4, 6, 3, 4, 3, 8, 6, 10, 3, 0, 3, 9, 10, 9, 3], [10, 9, 4, 6, 10, 4], [4, 9, 5, 7, 6, 11], [0, 8, 3, 4, 9, 5, 11, 7, 6], [5, 0, 1, 5, 4, 0, 7, 6, 11], [11, 7, 6, 8, 3, 4, 3, 5, 4, 3, 1, 5], [9, 5, 4, 10, 1, 2, 7, 6, 11], [6, 11, 7, 1, 2, 10, 0, 8, 3, 4, 9, 5], [7, 6, 11, 5, 4, 10, 4, 2, 10, 4, 0, 2], [3, 4, 8, 3, 5, 4, 3, 2, 5, 10, 5, 2, 11, 7, 6], [7, 2, 3, 7, 6, 2, 5, 4, 9], [9, 5, 4, 0, 8, 6, 0, 6, 2, 6, 8, 7], [3, 6, 2, 3, 7, 6, 1, 5, 0, 5, 4, 0], [6, 2, 8, 6, 8, 7, 2, 1, 8, 4, 8, 5, 1, 5, 8], [9, 5, 4, 10, 1, 6, 1, 7, 6, 1, 3, 7], [1, 6, 10, 1, 7, 6, 1, 0, 7, 8, 7, 0, 9, 5, 4], [4, 0, 10, 4, 10, 5, 0, 3, 10, 6, 10, 7, 3, 7, 10], [7, 6, 10, 7, 10, 8, 5, 4, 10, 4, 8, 10], [6, 9, 5, 6, 11, 9, 11, 8, 9], [3, 6, 11, 0, 6, 3, 0, 5, 6, 0, 9, 5], [0, 11, 8, 0, 5, 11, 0, 1, 5, 5, 6, 11], [6, 11, 3, 6, 3, 5, 5, 3, 1], [1, 2, 10, 9, 5, 11, 9, 11, 8, 11, 5, 6], [0, 11, 3, 0, 6, 11, 0, 9, 6, 5, 6, 9, 1, 2, 10], [11, 8, 5, 11, 5, 6, 8, 0, 5, 10, 5, 2, 0, 2, 5], [6, 11, 3, 6, 3, 5, 2, 10, 3, 10, 5, 3], [5, 8, 9, 5, 2, 8, 5, 6, 2, 3, 8, 2], [9, 5, 6, 9, 6, 0, 0, 6, 2], [1, 5, 8, 1, 8, 0, 5, 6, 8, 3, 8, 2, 6, 2, 8], [1, 5, 6, 2, 1, 6], [1, 3, 6, 1, 6, 10, 3, 8, 6, 5, 6, 9, 8, 9, 6], [10, 1, 0, 10, 0, 6, 9, 5, 0, 5, 6, 0], [0, 3, 8, 5, 6, 10], [10, 5, 6], [11, 5, 10, 7, 5, 11], [11, 5, 10, 11, 7, 5, 8, 3, 0], [5, 11, 7, 5, 10, 11, 1, 9, 0], [10, 7, 5, 10, 11, 7, 9, 8, 1, 8, 3, 1], [11, 1, 2, 11, 7, 1, 7, 5, 1], [0, 8, 3, 1, 2, 7, 1, 7, 5, 7, 2, 11], [9, 7, 5, 9, 2, 7, 9, 0, 2, 2, 11, 7], [7, 5, 2, 7, 2, 11, 5, 9, 2, 3, 2, 8, 9, 8, 2], [2, 5, 10, 2, 3, 5, 3, 7, 5], [8, 2, 0, 8, 5, 2, 8, 7, 5, 10, 2, 5], [9, 0, 1, 5, 10, 3, 5, 3, 7, 3, 10, 2], [9, 8, 2, 9, 2, 1, 8, 7, 2, 10, 2, 5, 7, 5, 2], [1, 3, 5, 3, 7, 5], [0, 8, 7, 0, 7, 1, 1, 7, 5], [9, 0, 3, 9, 3, 5, 5, 3, 7], [9, 8, 7, 5, 9, 7], [5, 8, 4, 5, 10, 8, 10, 11, 8], [5, 0, 4, 5, 11, 0, 5, 10, 11, 11, 3, 0], [0, 1, 9, 8, 4, 10, 8, 10, 11, 10, 4, 5], [10, 11, 4, 10, 4, 5, 11, 3, 4, 9, 4, 1, 3, 1, 4], [2, 5, 1, 2, 8, 5, 2, 11, 8, 4, 5, 8], [0, 4, 11, 0, 11, 3, 4, 5, 11, 2, 11, 1, 5, 1, 11], [0, 2, 5, 0, 5, 9, 2, 11, 5, 4, 5, 8, 11, 8, 5], [9, 4, 5, 2, 11, 3], [2, 5, 10, 3, 5, 2, 3, 4, 5, 3, 8, 4], [5, 10, 2, 5, 2, 4, 4, 2, 0], [3, 10, 2, 3, 5, 10, 3, 8, 5, 4, 5, 8, 0, 1, 9], [5, 10, 2, 5, 2, 4, 1, 9, 2, 9, 4, 2], [8, 4, 5, 8, 5, 3, 3, 5, 1], [0, 4, 5, 1, 0, 5], [8, 4, 5, 8, 5, 3, 9, 0, 5, 0, 3, 5], [9, 4, 5], [4, 11, 7, 4, 9, 11, 9, 10, 11], [0, 8, 3, 4, 9, 7, 9, 11, 7, 9, 10, 11], [1, 10, 11, 1, 11, 4, 1, 4, 0, 7, 4, 11], [3, 1, 4, 3, 4, 8, 1, 10, 4, 7, 4, 11, 10, 11, 4], [4, 11, 7, 9, 11, 4, 9, 2, 11, 9, 1, 2], [9, 7, 4, 9, 11, 7, 9, 1, 11, 2, 11, 1, 0, 8, 3], [11, 7, 4, 11, 4, 2, 2, 4, 0], [11, 7, 4, 11, 4, 2, 8, 3, 4, 3, 2, 4], [2, 9, 10, 2, 7, 9, 2, 3, 7, 7, 4, 9], [9, 10, 7, 9, 7, 4, 10, 2, 7, 8, 7, 0, 2, 0, 7], [3, 7, 10, 3, 10, 2, 7, 4, 10, 1, 10, 0, 4, 0, 10], [1, 10, 2, 8, 7, 4], [4, 9, 1, 4, 1, 7, 7, 1, 3], [4, 9, 1, 4, 1, 7, 0, 8, 1, 8, 7, 1], [4, 0, 3, 7, 4, 3], [4, 8, 7], [9, 10, 8, 10, 11, 8], [3, 0, 9, 3, 9, 11, 11, 9, 10], [0, 1, 10, 0, 10, 8, 8, 10, 11], [3, 1, 10, 11, 3, 10], [1, 2, 11, 1, 11, 9, 9, 11, 8], [3, 0, 9, 3, 9, 11, 1, 2, 9, 2, 11, 9], [0, 2, 11, 8, 0, 11], [3, 2, 11], [2, 3, 8, 2, 8, 10, 10, 8, 9], [9, 10, 2, 0, 9, 2], [2, 3, 8, 2, 8, 10, 0, 1, 8, 1, 10, 8], [1, 10, 2], [1, 3, 8, 9, 1, 8], [0, 9, 1], [0, 3, 8], []]
+cornersFromEdge = [[0,1,2,3,4,5,6,7,0,1,2,3], [1,2,3,0,5,6,7,4,4,5,6,7]]
+
+def sphere_func(x, y, z):
+    # works on scalars and on numpy arrays
+    return 1 * np.sqrt((x - 0.5)**2 + (y - 0.5)**2 + (z - 0.5)**2)
+
+
+# corner positions in the (i, j, k) lattice: bit c of a cube index is corner c
+cornerOffsets = np.array([[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1],
+                          [0, 1, 0], [1, 1, 0], [1, 1, 1], [0, 1, 1]])
+
+# triTable as a (256, 16) array, padded with -1
+triTableArray = np.full((256, 16), -1, dtype=np.int64)
+for cubeIndex, triangulation in enumerate(triTable):
+    triTableArray[cubeIndex, :len(triangulation)] = triangulation
+triCount = (triTableArray >= 0).sum(axis=1) // 3
+
+# edge e joins corners cornersFromEdge[0][e] and cornersFromEdge[1][e]:
+# its lower corner and its axis
+edgeLower = np.minimum(cornerOffsets[cornersFromEdge[0]], cornerOffsets[cornersFromEdge[1]])
+edgeAxis = np.argmax(cornerOffsets[cornersFromEdge[1]] != cornerOffsets[cornersFromEdge[0]], axis=1)
+
+
+def sample_volume(f, res, x_min=0, x_max=1, y_min=0, y_max=1, z_min=0, z_max=1):
+    # f(x, y, z) evaluated on arrays, at (res+1)^3 lattice nodes
+    x = np.linspace(x_min, x_max, res + 1)
+    y = np.linspace(y_min, y_max, res + 1)
+    z = np.linspace(z_min, z_max, res + 1)
+    return f(*np.meshgrid(x, y, z, indexing='ij'))
+
+
+def cube_indices(volume, level=surfaceLevel):
+    # bit c of a cell is set if its corner c is below the level
+    nx, ny, nz = volume.shape
+    below = volume < level
+    indices = np.zeros((nx - 1, ny - 1, nz - 1), dtype=np.uint8)
+    for c, (i, j, k) in enumerate(cornerOffsets):
+        indices |= below[i:i+nx-1, j:j+ny-1, k:k+nz-1].astype(np.uint8) << c
+    return indices
+
+
+def triangle_edges(indices, cells):
+    # the lattice edges of the triangle corners of the (n, 3) cells with
+    # cube indices `indices`, as (node, axis): the edge goes from node to
+    # node + 1 along axis
+    triangulation = triTableArray[indices]
+    row, slot = np.nonzero(triangulation >= 0)
+    edge = triangulation[row, slot]
+    return cells[row] + edgeLower[edge], edgeAxis[edge]
+
+
+def edge_ids(node, axis, shape):
+    # unique id of a lattice edge: 3 * (flat index of its first node) + axis
+    return np.ravel_multi_index(tuple(node.T), shape).astype(np.int64) * 3 + axis
+
+
+def interpolate_edges(values, node, axis, level=surfaceLevel):
+    # lattice coordinates of the level crossings on the edges (node, axis),
+    # values(nodes) gives the field at (n, 3) lattice nodes
+    step = np.eye(3, dtype=np.int64)[axis]
+    value_a = values(node)
+    value_b = values(node + step)
+    t = (level - value_a) / (value_b - value_a)
+    return node + t[:, None] * step
+
+
+def march_volume(volume, x_min=0, x_max=1, y_min=0, y_max=1, z_min=0, z_max=1, level=surfaceLevel):
+    # marching cubes on a precomputed (nx, ny, nz) volume of node values,
+    # node (i, j, k) at (x_min + i*dx, y_min + j*dy, z_min + k*dz)
+    # returns the (V, 3) vertices and the (F, 3) faces of an indexed mesh:
+    # each crossed lattice edge gives one vertex, shared by its triangles
+    volume = np.asarray(volume, dtype=np.float64)
+    if volume.ndim != 3 or min(volume.shape) < 2:
+        raise ValueError("volume must be 3d with at least 2 nodes per axis")
+    lo = np.array([x_min, y_min, z_min], dtype=np.float64)
+    spacing = (np.array([x_max, y_max, z_max], dtype=np.float64) - lo) / (np.array(volume.shape) - 1)
+
+    indices = cube_indices(volume, level)
+    cells = np.argwhere(triCount[indices] > 0)
+    node, axis = triangle_edges(indices[cells[:, 0], cells[:, 1], cells[:, 2]], cells)
+    ids, faces = np.unique(edge_ids(node, axis, volume.shape), return_inverse=True)
+    node = np.stack(np.unravel_index(ids // 3, volume.shape), axis=1)
+    values = lambda n: volume[n[:, 0], n[:, 1], n[:, 2]]
+    vertices = lo + interpolate_edges(values, node, ids % 3, level) * spacing
+    return vertices, faces.reshape(-1, 3)
+
+
+class ObjWriter:
+    # writes a mesh to a Wavefront .obj file as it is produced: faces use
+    # the global (0-based) index of the vertices written so far
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.vertex_count = 0
+        self.face_count = 0
+
+    def write(self, vertices, faces):
+        np.savetxt(self.file, vertices, fmt='v %.9g %.9g %.9g')
+        np.savetxt(self.file, np.asarray(faces) + 1, fmt='f %d %d %d')
+        self.vertex_count += len(vertices)
+        self.face_count += len(faces)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArrayWriter:
+    # keeps the mesh written by march_slabs() in memory
+    def __init__(self):
+        self.vertices = []
+        self.faces = []
+
+    def write(self, vertices, faces):
+        self.vertices.append(vertices)
+        self.faces.append(faces)
+
+    def arrays(self):
+        # the (V, 3) vertices and the (F, 3) faces
+        return (np.concatenate(self.vertices or [np.zeros((0, 3))]),
+                np.concatenate(self.faces or [np.zeros((0, 3), dtype=np.int64)]))
+
+
+def band_slabs(centers, widths, lo, spacing, res, neighbours=1):
+    # generator over the z-slabs of cells of the res^3 grid: for every
+    # slab, the (res, res) mask of its cells that meet the leaves (given by
+    # their (n, 3) centers and (n,) widths) grown by `neighbours` times
+    # their width on every side; the boxes of the leaves crossing the slab
+    # are added up in a 2d difference array, so that the memory is O(res^2)
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    radius = (0.5 + neighbours) * np.asarray(widths, dtype=np.float64).reshape(-1, 1)
+    first = np.clip(np.floor((centers - radius - lo) / spacing), 0, res - 1).astype(np.int64)
+    last = np.clip(np.ceil((centers + radius - lo) / spacing) - 1, 0, res - 1).astype(np.int64)
+    # the leaves crossing every slab, as (slab, leaf) pairs sorted by slab
+    counts = np.maximum(last[:, 2] - first[:, 2] + 1, 0)
+    leaf = np.repeat(np.arange(len(counts)), counts)
+    slab = first[leaf, 2] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.argsort(slab, kind='stable')
+    leaf = leaf[order]
+    bounds = np.searchsorted(slab[order], np.arange(res + 1))
+    del slab, order
+    for k in range(res):
+        l = leaf[bounds[k]:bounds[k + 1]]
+        difference = np.zeros((res + 1, res + 1), dtype=np.int32)
+        np.add.at(difference, (first[l, 0], first[l, 1]), 1)
+        np.add.at(difference, (last[l, 0] + 1, first[l, 1]), -1)
+        np.add.at(difference, (first[l, 0], last[l, 1] + 1), -1)
+        np.add.at(difference, (last[l, 0] + 1, last[l, 1] + 1), 1)
+        yield difference.cumsum(axis=0).cumsum(axis=1)[:res, :res] > 0
+
+
+def march_slabs(f, res, writer, x_min=0, x_max=1, y_min=0, y_max=1, z_min=0, z_max=1, level=surfaceLevel, centers=None, widths=None, neighbours=1):
+    # marching cubes on the res^3 grid, one z-slab of cells at a time:
+    # only two (res+1, res+1) slices of f(x, y, z) (on arrays) and the
+    # vertex ids on the face shared with the next slab are kept, and every
+    # slab is passed to writer.write(vertices, faces) as soon as it is done
+    # (faces index all the vertices written so far), so that the memory
+    # does not depend on the number of slabs
+    # centers, widths: only march the cells near these octree leaves
+    # (see band_slabs() and march_band())
+    # returns the number of vertices and of faces written
+    lo = np.array([x_min, y_min, z_min], dtype=np.float64)
+    spacing = (np.array([x_max, y_max, z_max], dtype=np.float64) - lo) / res
+    shape = (res + 1, res + 1, res + 1)
+    x = np.linspace(x_min, x_max, res + 1)
+    y = np.linspace(y_min, y_max, res + 1)
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    z = np.linspace(z_min, z_max, res + 1)
+    if centers is not None:
+        masks = band_slabs(centers, widths, lo, spacing, res, neighbours)
+
+    def evaluate(values, k, band):
+        # fills in the values of slice k at the nodes of the (res, res)
+        # cells of the band that are not known yet
+        nodes = np.zeros((res + 1, res + 1), dtype=bool)
+        for i in range(2):
+            for j in range(2):
+                nodes[i:i+res, j:j+res] |= band
+        nodes &= np.isnan(values)
+        values[nodes] = f(X[nodes], Y[nodes], np.full(np.count_nonzero(nodes), z[k]))
+
+    vertex_count = 0
+    face_count = 0
+    # edge ids (sorted) and vertex indices on the top face of the last slab
+    shared_ids = np.zeros(0, dtype=np.int64)
+    shared_vertices = np.zeros(0, dtype=np.int64)
+    top = np.full((res + 1, res + 1), np.nan)
+    for k in range(res):
+        bottom, top = top, np.full((res + 1, res + 1), np.nan)
+        if centers is None:
+            if k == 0:
+                bottom[...] = f(X, Y, np.full_like(X, z[0]))
+            top[...] = f(X, Y, np.full_like(X, z[k + 1]))
+        else:
+            band = next(masks)
+            evaluate(bottom, k, band)
+            evaluate(top, k + 1, band)
+        slab = np.stack([bottom, top], axis=2)
+        indices = cube_indices(slab, level)
+        if centers is not None:
+            # no triangles outside of the band
+            indices[~band, 0] = 0
+        cells = np.argwhere(triCount[indices] > 0)
+        node, axis = triangle_edges(indices[cells[:, 0], cells[:, 1], cells[:, 2]], cells)
+        node[:, 2] += k
+        ids, faces = np.unique(edge_ids(node, axis, shape), return_inverse=True)
+        node = np.stack(np.unravel_index(ids // 3, shape), axis=1)
+
+        # vertices on the bottom face were written with the last slab
+        index = np.empty(len(ids), dtype=np.int64)
+        position = np.minimum(np.searchsorted(shared_ids, ids), max(len(shared_ids) - 1, 0))
+        shared = (shared_ids[position] == ids) if len(shared_ids) else np.zeros(len(ids), dtype=bool)
+        index[shared] = shared_vertices[position[shared]]
+        new = np.flatnonzero(~shared)
+        index[new] = vertex_count + np.arange(len(new))
+
+        node = node[new]
+        node[:, 2] -= k
+        values = lambda n: slab[n[:, 0], n[:, 1], n[:, 2]]
+        vertices = interpolate_edges(values, node, ids[new] % 3, level)
+        vertices[:, 2] += k
+        writer.write(lo + vertices * spacing, index[faces].reshape(-1, 3))
+        vertex_count += len(new)
+        face_count += len(faces) // 3
+
+        on_top = (ids // 3) % shape[2] == k + 1
+        shared_ids, shared_vertices = ids[on_top], index[on_top]
+    return vertex_count, face_count
+
+
+def march_band(f, centers, widths, res, x_min=0, x_max=1, y_min=0, y_max=1, z_min=0, z_max=1, level=surfaceLevel, neighbours=1):
+    # marching cubes restricted to the cells of the res^3 grid near the
+    # octree leaves given by their (n, 3) centers and (n,) widths:
+    # f(x, y, z) (on arrays) is only evaluated at the nodes of these cells,
+    # one z-slab at a time (see march_slabs()).
+    # With the Poisson indicator function, whose support is the leaves and
+    # their neighbours, this is the whole surface. For instance:
+    #   centers, widths = leaf_arrays(leaf_nodes)
+    #   f = lambda x, y, z: indicator_batch(np.stack([x, y, z], axis=1), x_vec, leaf_nodes)
+    # returns the (V, 3) vertices and the (F, 3) faces; the memory is
+    # O(res^2) besides the mesh itself
+    writer = ArrayWriter()
+    march_slabs(f, res, writer, x_min, x_max, y_min, y_max, z_min, z_max, level, centers, widths, neighbours)
+    return writer.arrays()
+
+def march(f, x_min=0, x_max=1, y_min=0, y_max=1, z_min=0, z_max=1):
+    # mesh of the level set of f(x, y, z) (on arrays) on the res^3 grid
+    volume = sample_volume(f, res, x_min, x_max, y_min, y_max, z_min, z_max)
+    vertices, faces = march_volume(volume, x_min, x_max, y_min, y_max, z_min, z_max)
+    return trimesh.Trimesh(vertices=vertices, faces=faces)
+
+
+def main():
+    tic = time.time()
+    mesh = march(sphere_func)
+    print(time.time() - tic)
+    mesh.show()
+    #mesh = trimesh.Trimesh(vertices=[[0, 0, 0], [0, 0, 1], [0, 1, 0]], faces=[[0, 1, 2]])
+    #mesh.show()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
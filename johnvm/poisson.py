@@ -1,8 +1,16 @@
+from contextlib import contextmanager
 import numpy as np
+import numba
 from dataclasses import dataclass, field
+from functools import cached_property
 from typing import List
-from tqdm import tqdm
-from numba import jit
+from numba import jit, prange
+from scipy import sparse
+import scipy.sparse.linalg
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+from johnvm.util_io import write_pcb, open_pcb, chunk_bbox
+from johnvm.solvers import SOLVERS, Symmetric_Matrix
 # from functools import total_ordering
 
 
@@ -56,72 +64,265 @@ class Oriented_Point(Point):
     nz: float = field(default=0.00)
 
 
-@dataclass
+def voxel_keys(positions, cell_size: float):
+    """
+    Integer key of the cell (voxel) of a grid of spacing `cell_size`
+    that contains each one of the (N, 3) positions.
+    Two points have the same key if and only if they are in the
+    same cell.
+    """
+    cells = np.floor(positions / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    if np.prod(dims.astype(np.float64)) < 2.00**62:
+        return np.ravel_multi_index(tuple(cells.T), dims)
+    # too many cells for a single integer: number the occupied ones
+    return np.unique(cells, axis=0, return_inverse=True)[1].ravel()
+
+
+@dataclass(eq=False)
 class Oriented_Points:
     """
     Collector for unique oriented points.
+    The locations and the normals are stored column-wise,
+    as two contiguous (N, 3) arrays.
     """
-    points: List[Oriented_Point] = field(default_factory=list)
+    positions: np.ndarray = field(
+        default_factory=lambda: np.empty((0, 3)))
+    normals: np.ndarray = field(
+        default_factory=lambda: np.empty((0, 3)))
+
+    def __post_init__(self):
+        self.positions = np.asarray(self.positions).reshape(-1, 3)
+        self.normals = np.asarray(self.normals).reshape(-1, 3)
+        if self.positions.shape != self.normals.shape:
+            raise ValueError('Positions and normals must have the '
+                             'same shape: '
+                             + repr(self.positions.shape) + ', '
+                             + repr(self.normals.shape))
+
+    @classmethod
+    def from_arrays(cls, positions, normals=None):
+        """
+        Build the collector from an (N, 3) array of locations
+        and an (N, 3) array of normals (zero if not given).
+        The arrays are used as they are, without copying
+        or checking for duplicates.
+        """
+        positions = np.asarray(positions)
+        if normals is None:
+            normals = np.zeros_like(positions)
+        return cls(positions, normals)
+
+    @classmethod
+    def from_npts_file(cls, file_name):
+        """
+        Reads a point cloud file written by `to_npts_file`.
+        file_name: name of the file *without the extension*
+        """
+        point_matrix = np.loadtxt(file_name+'.npts', ndmin=2)
+        return cls(point_matrix[:, 0:3], point_matrix[:, 3:6])
+
+    @classmethod
+    def from_pcb_file(cls, file_name, mode='r'):
+        """
+        Opens a binary point cloud file written by `to_pcb_file`.
+        The file is memory-mapped: the positions and normals are
+        views into the file and nothing is parsed or copied.
+        file_name: name of the file *without the extension*
+        mode: 'r' (read-only), 'r+' (write through) or 'c'
+        (copy-on-write), as in `np.memmap`
+        """
+        records = open_pcb(file_name+'.pcb', mode)
+        return cls(records[:, 0:3], records[:, 3:6])
 
     def add(self, pt: Oriented_Point):
         """
         Add a point in the list of points,
-        if it is not already in
+        if it is not already in.
+        For single points only: every call scans and copies all the
+        stored points. Bulk input goes through `from_arrays` or
+        `add_many`.
         """
-        if pt not in self.points:
-            self.points.append(pt)
-        else:
+        location = np.array([pt.x, pt.y, pt.z])
+        if np.any(np.all(self.positions == location, axis=1)):
             raise ValueError('Oriented point already exists: '
                              + repr(pt))
+        self.positions = np.vstack((self.positions, location))
+        self.normals = np.vstack((self.normals, [pt.nx, pt.ny, pt.nz]))
+
+    def add_many(self, positions, normals=None,
+                 policy: str = 'raise', tolerance: float = 0.00):
+        """
+        Add an (N, 3) array of points (and normals) in one go.
+        Duplicates, both among the new points and with the points
+        already stored, are found with a single lexicographic sort.
+        With `tolerance` > 0 the points falling in the same cell of a
+        grid of that spacing are considered duplicates (near-duplicates).
+        policy: what to do with duplicates:
+            'raise': raise a ValueError and leave the collector as is
+            'drop': keep the first occurrence only
+            'merge': keep the first occurrence, with the normalized
+                     sum of the normals of the whole group
+        Returns the number of points that were dropped or merged.
+        """
+        if policy not in ('raise', 'drop', 'merge'):
+            raise ValueError('Unknown duplicate policy: ' + repr(policy))
+        positions = np.asarray(positions).reshape(-1, 3)
+        if normals is None:
+            normals = np.zeros_like(positions)
+        normals = np.asarray(normals).reshape(-1, 3)
+        # stored points go first, so that they win over the new ones
+        all_positions = np.concatenate((self.positions, positions))
+        all_normals = np.concatenate((self.normals, normals))
+        if len(all_positions) == 0:
+            return 0
+        if tolerance > 0.00:
+            keys = voxel_keys(all_positions, tolerance)
+        else:
+            keys = all_positions
+        # (stable) sort by x, then y, then z:
+        # duplicates end up next to each other, in order of appearance
+        if keys.ndim == 1:
+            order = np.argsort(keys, kind='stable')
+        else:
+            order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+        sorted_keys = keys[order].reshape(len(order), -1)
+        first = np.empty(len(order), dtype=bool)
+        first[0] = True
+        np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1, out=first[1:])
+        del keys, sorted_keys
+        n_duplicates = len(order) - np.count_nonzero(first)
+        if n_duplicates == 0:
+            self.positions = all_positions
+            self.normals = all_normals
+            return 0
+        if policy == 'raise':
+            i = np.flatnonzero(~first)[0]
+            raise ValueError('Oriented point already exists: '
+                             + repr(all_positions[order[i]])
+                             + ' (' + str(n_duplicates)
+                             + ' duplicates in total)')
+        kept = order[first]
+        # keep the original ordering of the points
+        ordering = np.argsort(kept)
+        kept = kept[ordering]
+        merged_normals = all_normals[kept]
+        if policy == 'merge':
+            group = np.cumsum(first) - 1
+            counts = np.bincount(group)[ordering]
+            sums = np.column_stack([
+                np.bincount(group, weights=all_normals[order, k])
+                for k in range(3)
+            ])[ordering]
+            lengths = np.linalg.norm(sums, axis=1)
+            merged = (counts > 1) & (lengths > 0.00)
+            merged_normals[merged] = \
+                sums[merged] / lengths[merged, np.newaxis]
+        self.positions = all_positions[kept]
+        self.normals = merged_normals
+        return n_duplicates
+
+    def voxel_downsample(self, cell_size: float = None,
+                         n_target: int = None):
+        """
+        Replace the points falling in the same cell of a grid of
+        spacing `cell_size` by a single point, at their average
+        location and with their (normalized) summed normal.
+        Alternatively, `n_target` chooses the cell size so that
+        at most (and about) `n_target` points remain.
+        Returns a new collector.
+        """
+        if (cell_size is None) == (n_target is None):
+            raise ValueError('Give exactly one of cell_size and n_target')
+        if n_target is not None:
+            cell_size = self._cell_size_for(n_target)
+        keys = voxel_keys(self.positions, cell_size)
+        _, group, counts = np.unique(keys, return_inverse=True,
+                                     return_counts=True)
+        group = group.ravel()
+        del keys
+        positions = np.column_stack([
+            np.bincount(group, weights=self.positions[:, k])
+            for k in range(3)
+        ]) / counts[:, np.newaxis]
+        normals = np.column_stack([
+            np.bincount(group, weights=self.normals[:, k])
+            for k in range(3)
+        ])
+        lengths = np.linalg.norm(normals, axis=1)
+        nonzero = lengths > 0.00
+        normals[nonzero] /= lengths[nonzero, np.newaxis]
+        return Oriented_Points(positions, normals)
+
+    def _cell_size_for(self, n_target: int):
+        """
+        Bisection (in log scale) for the smallest cell size that
+        leaves at most `n_target` occupied cells.
+        """
+        if n_target < 1:
+            raise ValueError('n_target must be positive')
+        # one cell covers everything (up to grid alignment)
+        hi = 2.00 * max(self.bbox_dim())
+        if len(self) <= n_target:
+            return hi / 2.00**21
+        lo = hi / 2.00**21
+        for _ in range(40):
+            mid = np.sqrt(lo * hi)
+            n = len(np.unique(voxel_keys(self.positions, mid)))
+            if n > n_target:
+                lo = mid
+            else:
+                hi = mid
+                if n >= 0.95 * n_target:
+                    break
+        return hi
+
+    def take(self, indices):
+        """
+        Return a new collector with the points
+        at the given indices (or boolean mask)
+        """
+        return Oriented_Points(self.positions[indices],
+                               self.normals[indices])
 
     def bbox_center(self):
         """
         Compute the center of the bouding box
         """
-        xs = [pt.x for pt in self.points]
-        ys = [pt.y for pt in self.points]
-        zs = [pt.z for pt in self.points]
-        dX = (max(xs) + min(xs)) / 2.00
-        dY = (max(ys) + min(ys)) / 2.00
-        dZ = (max(zs) + min(zs)) / 2.00
-        center = Point(dX, dY, dZ)
-        return center
+        # (in double precision, also for float32 storage)
+        lo = self.positions.min(axis=0).astype(np.float64)
+        hi = self.positions.max(axis=0).astype(np.float64)
+        center = (hi + lo) / 2.00
+        return Point(*center.tolist())
 
     def bbox_dim(self):
         """
         Compute the dimensions of the bouding box
         """
-        xs = [pt.x for pt in self.points]
-        ys = [pt.y for pt in self.points]
-        zs = [pt.z for pt in self.points]
-        dX = max(xs) - min(xs) + 2.00 * EPSILON
-        dY = max(ys) - min(ys) + 2.00 * EPSILON
-        dZ = max(zs) - min(zs) + 2.00 * EPSILON
-        return (dX, dY, dZ)
+        lo = self.positions.min(axis=0).astype(np.float64)
+        hi = self.positions.max(axis=0).astype(np.float64)
+        dims = hi - lo + 2.00 * EPSILON
+        return tuple(dims.tolist())
 
     def split_along_plane(self,
                           center: Point,
                           plane: str):
-        group1 = Oriented_Points()
-        group2 = Oriented_Points()
+        """
+        Split the points in two groups, below and above
+        the plane passing through `center`
+        """
         if plane == "xy":
-            for pt in self.points:
-                if pt.z < center.z:
-                    group1.add(pt)
-                else:
-                    group2.add(pt)
+            coords, c = self.positions[:, 2], center.z
         elif plane == "xz":
-            for pt in self.points:
-                if pt.y < center.y:
-                    group1.add(pt)
-                else:
-                    group2.add(pt)
+            coords, c = self.positions[:, 1], center.y
         elif plane == "yz":
-            for pt in self.points:
-                if pt.x < center.x:
-                    group1.add(pt)
-                else:
-                    group2.add(pt)
+            coords, c = self.positions[:, 0], center.x
+        else:
+            raise ValueError('Unknown plane: ' + repr(plane))
+        below = coords < c
+        group1 = self.take(np.flatnonzero(below))
+        group2 = self.take(np.flatnonzero(~below))
         return (group1, group2)
 
     def to_npts_file(self, file_name):
@@ -131,15 +332,280 @@ class Oriented_Points:
         point's location and normal.
         file_name: name of the file *without the extension*
         """
-        point_matrix = np.full((len(self.points), 6), 0.00)
-        for i, pt in enumerate(self.points):
-            point_matrix[i, :] = np.array(
-                [pt.x, pt.y, pt.z, pt.nx, pt.ny, pt.nz]
-            )
+        point_matrix = np.hstack((self.positions, self.normals))
         np.savetxt(file_name+'.npts', point_matrix, delimiter=' ')
 
+    def to_pcb_file(self, file_name, dtype=np.float64):
+        """
+        Generates a binary point cloud file (see `johnvm.util_io`),
+        that can be opened without parsing with `from_pcb_file`.
+        file_name: name of the file *without the extension*
+        dtype: np.float64, or np.float32 (lossy, see `write_pcb`)
+        """
+        write_pcb(file_name+'.pcb', self.positions, self.normals, dtype)
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    def __getitem__(self, i):
+        return Oriented_Point(*self.positions[i], *self.normals[i])
+
     def __repr__(self):
-        return str(len(self.points)) + " points."
+        return str(len(self)) + " points."
+
+
+def streaming_bbox(chunks):
+    """
+    Computes the equivalent of `bbox_center` and `bbox_dim`
+    in a single pass over a stream of (positions, normals) chunks
+    (e.g. `johnvm.util_io.iter_chunks`), without loading the points.
+    """
+    lo, hi = chunk_bbox(chunks)
+    center = Point(*((hi + lo) / 2.00).tolist())
+    dims = tuple((hi - lo + 2.00 * EPSILON).tolist())
+    return center, dims
+
+
+def streaming_voxel_downsample(chunks, cell_size: float, lo):
+    """
+    `Oriented_Points.voxel_downsample` (same grid, same result up to
+    rounding) over a stream of (positions, normals) chunks
+    (e.g. `johnvm.util_io.iter_chunks`), without loading the points:
+    the sums of the locations and normals and the number of points of
+    every occupied cell are accumulated chunk by chunk, so that the
+    memory is bounded by the number of cells (the size of the result)
+    plus one chunk, whatever the size of the file.
+    lo: (3,) minimum coordinates of all the points (e.g. the first
+    output of `johnvm.util_io.chunk_bbox`, from a first pass),
+    to number the cells
+    For a file:
+        lo, hi = chunk_bbox(iter_chunks(path))
+        pts = streaming_voxel_downsample(iter_chunks(path), cell_size, lo)
+    Returns a new collector, small enough to build an octree from.
+    """
+    if cell_size <= 0.00:
+        raise ValueError('cell_size must be positive')
+    origin = np.floor(np.asarray(lo, dtype=np.float64).reshape(3)
+                      / cell_size).astype(np.int64)
+    # the cells are numbered on a grid of 2^20 cells per axis from `lo`
+    dims = np.full(3, 2**20, dtype=np.int64)
+    keys = np.zeros(0, dtype=np.int64)
+    sums = np.zeros((0, 7))  # location, normal, count
+    for positions, normals in chunks:
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if len(positions) == 0:
+            continue
+        cells = np.floor(positions / cell_size).astype(np.int64) - origin
+        if np.any(cells < 0):
+            raise ValueError('Point below `lo`: ' + repr(
+                positions[np.flatnonzero(np.any(cells < 0, axis=1))[0]]))
+        if np.any(cells >= dims):
+            raise ValueError('More than ' + str(dims[0]) + ' cells '
+                             'along an axis: use a larger cell_size')
+        values = np.zeros((len(positions), 7))
+        values[:, 0:3] = positions
+        if normals is not None:
+            values[:, 3:6] = normals
+        values[:, 6] = 1.00
+        # merge the chunk with the cells seen so far
+        all_keys, group = np.unique(
+            np.concatenate((keys, np.ravel_multi_index(tuple(cells.T),
+                                                       dims))),
+            return_inverse=True)
+        group = group.ravel()
+        all_values = np.concatenate((sums, values))
+        sums = np.column_stack([
+            np.bincount(group, weights=all_values[:, k],
+                        minlength=len(all_keys))
+            for k in range(7)
+        ])
+        keys = all_keys
+        del values, all_values, group
+    if len(keys) == 0:
+        raise ValueError('Empty point cloud')
+    positions = sums[:, 0:3] / sums[:, 6:7]
+    normals = sums[:, 3:6]
+    lengths = np.linalg.norm(normals, axis=1)
+    nonzero = lengths > 0.00
+    normals[nonzero] /= lengths[nonzero, np.newaxis]
+    return Oriented_Points(positions, normals)
+
+
+@jit(nopython=True)
+def smallest_eigenvector(c00, c01, c02, c11, c12, c22):
+    """
+    Unit eigenvector of the smallest eigenvalue of a symmetric
+    3x3 matrix (closed-form eigenvalues, then the largest cross
+    product of two rows of the shifted matrix).
+    """
+    # eigenvalues with the trigonometric formula
+    p1 = c01**2 + c02**2 + c12**2
+    q = (c00 + c11 + c22) / 3.0
+    p2 = (c00 - q)**2 + (c11 - q)**2 + (c22 - q)**2 + 2.0 * p1
+    p = np.sqrt(p2 / 6.0)
+    if p < EPSILON * (abs(q) + EPSILON):
+        # (almost) a multiple of the identity: any direction works
+        return 0.0, 0.0, 1.0
+    b00 = (c00 - q) / p
+    b11 = (c11 - q) / p
+    b22 = (c22 - q) / p
+    b01 = c01 / p
+    b02 = c02 / p
+    b12 = c12 / p
+    r = (b00 * (b11 * b22 - b12 * b12)
+         - b01 * (b01 * b22 - b12 * b02)
+         + b02 * (b01 * b12 - b11 * b02)) / 2.0
+    r = min(max(r, -1.0), 1.0)
+    phi = np.arccos(r) / 3.0
+    lam = q + 2.0 * p * np.cos(phi + 2.0 * np.pi / 3.0)
+    # rows of (C - lam I): the eigenvector is orthogonal to all of them
+    a00 = c00 - lam
+    a11 = c11 - lam
+    a22 = c22 - lam
+    x0 = c01 * c12 - c02 * a11
+    y0 = c02 * c01 - a00 * c12
+    z0 = a00 * a11 - c01 * c01
+    x1 = c01 * a22 - c02 * c12
+    y1 = c02 * c02 - a00 * a22
+    z1 = a00 * c12 - c01 * c02
+    x2 = a11 * a22 - c12 * c12
+    y2 = c12 * c02 - c01 * a22
+    z2 = c01 * c12 - a11 * c02
+    n0 = x0 * x0 + y0 * y0 + z0 * z0
+    n1 = x1 * x1 + y1 * y1 + z1 * z1
+    n2 = x2 * x2 + y2 * y2 + z2 * z2
+    if n0 >= n1 and n0 >= n2:
+        x, y, z, nn = x0, y0, z0, n0
+    elif n1 >= n2:
+        x, y, z, nn = x1, y1, z1, n1
+    else:
+        x, y, z, nn = x2, y2, z2, n2
+    if nn == 0.0:
+        return 0.0, 0.0, 1.0
+    nn = np.sqrt(nn)
+    return x / nn, y / nn, z / nn
+
+
+@jit(nopython=True, parallel=True)
+def pca_normals(positions, neighbours):
+    """
+    Direction of least variance of the locations of the
+    k neighbours of each point. neighbours: (N, k) array of indices
+    """
+    n, k = neighbours.shape
+    normals = np.empty((n, 3))
+    for i in prange(n):
+        mx = 0.0
+        my = 0.0
+        mz = 0.0
+        for j in range(k):
+            q = neighbours[i, j]
+            mx += positions[q, 0]
+            my += positions[q, 1]
+            mz += positions[q, 2]
+        mx /= k
+        my /= k
+        mz /= k
+        c00 = c01 = c02 = c11 = c12 = c22 = 0.0
+        for j in range(k):
+            q = neighbours[i, j]
+            dx = positions[q, 0] - mx
+            dy = positions[q, 1] - my
+            dz = positions[q, 2] - mz
+            c00 += dx * dx
+            c01 += dx * dy
+            c02 += dx * dz
+            c11 += dy * dy
+            c12 += dy * dz
+            c22 += dz * dz
+        normals[i, 0], normals[i, 1], normals[i, 2] = \
+            smallest_eigenvector(c00, c01, c02, c11, c12, c22)
+    return normals
+
+
+@jit(nopython=True)
+def propagate_orientation(normals, order, predecessors):
+    """
+    Flip the normals along a traversal of a tree, so that each normal
+    agrees with the one of its predecessor. Predecessors equal to
+    len(normals) point to a virtual root oriented along +z.
+    """
+    n = normals.shape[0]
+    for i in order:
+        p = predecessors[i]
+        if p < 0:
+            continue
+        if p == n:
+            dot = normals[i, 2]
+        else:
+            dot = (normals[i, 0] * normals[p, 0]
+                   + normals[i, 1] * normals[p, 1]
+                   + normals[i, 2] * normals[p, 2])
+        if dot < 0.00:
+            normals[i, 0] = -normals[i, 0]
+            normals[i, 1] = -normals[i, 1]
+            normals[i, 2] = -normals[i, 2]
+
+
+def estimate_normals(positions, k: int = 10, orientation='mst',
+                     workers: int = -1):
+    """
+    Estimates the normals of an unoriented point cloud.
+    The normal of each point is the direction of least variance
+    of its k nearest neighbours (PCA).
+    orientation:
+        'mst': consistent orientation, propagated along the minimum
+               spanning tree of the k-nearest-neighbours graph
+               (weights 1 - |n_i . n_j|), starting from the highest
+               point of every connected part, oriented along +z
+        'centroid': pointing away from the centroid of the cloud
+        (3,) array: pointing towards this viewpoint (e.g. scanner)
+        None: arbitrary orientation
+    workers: number of processes for the neighbours search
+             (-1: all cores)
+    Returns the Oriented_Points, ready for the Octree
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.float64)
+    n = len(positions)
+    k = min(k, n)
+    tree = cKDTree(positions)
+    _, neighbours = tree.query(positions, k=k, workers=workers)
+    neighbours = neighbours.reshape(n, k)
+    normals = pca_normals(positions, neighbours)
+    if isinstance(orientation, str) and orientation == 'mst':
+        # k-nearest-neighbours graph (without self loops),
+        # weights must be > 0 to be considered as edges
+        rows = np.repeat(np.arange(n), k - 1)
+        cols = neighbours[:, 1:].ravel()
+        weights = 1.00 - np.abs(
+            np.einsum('ij,ij->i', normals[rows], normals[cols])
+        ) + EPSILON
+        graph = sparse.csr_matrix((weights, (rows, cols)), shape=(n, n))
+        tree = csgraph.minimum_spanning_tree(graph)
+        # one root per connected part: its highest point,
+        # connected to a virtual root (node n)
+        n_parts, part = csgraph.connected_components(tree, directed=False)
+        by_height = np.lexsort((positions[:, 2], part))
+        roots = by_height[np.searchsorted(part[by_height],
+                                          np.arange(n_parts),
+                                          side='right') - 1]
+        tree = tree.tocoo()
+        tree = sparse.csr_matrix(
+            (np.concatenate((tree.data, np.ones(n_parts))),
+             (np.concatenate((tree.row, np.full(n_parts, n))),
+              np.concatenate((tree.col, roots)))),
+            shape=(n + 1, n + 1)
+        )
+        order, predecessors = csgraph.breadth_first_order(
+            tree, n, directed=False)
+        propagate_orientation(normals, order, predecessors)
+    elif isinstance(orientation, str) and orientation == 'centroid':
+        outward = positions - positions.mean(axis=0)
+        normals[np.einsum('ij,ij->i', normals, outward) < 0.00] *= -1.00
+    elif orientation is not None:
+        inward = np.asarray(orientation, dtype=np.float64) - positions
+        normals[np.einsum('ij,ij->i', normals, inward) < 0.00] *= -1.00
+    return Oriented_Points(positions, normals)
 
 
 ##########
@@ -169,33 +635,49 @@ class Node:
     parent: 'Node'
     children: List['Node'] = field(default_factory=list)
 
-    def subdivide(self, max_depth):
+    # indices of the contents in the points of the octree
+    indices: np.ndarray = None
+
+    def subdivide(self, max_depth, max_points=None, min_width=None):
         """
-        Subdivide `depth` times
+        Subdivide `depth` times.
+        Adaptive mode: a node holding at most `max_points` samples,
+        or not wider than `min_width`, is not subdivided further.
         """
         pts = self.contents
+        if max_points is not None and len(pts) <= max_points:
+            return
+        if min_width is not None and self.width <= min_width:
+            return
         # If the node contains any points
-        if pts.points:
+        if len(pts):
             # Must subdivide.
             # Make children:
+            indices = self.indices
             self.contents = None
+            self.indices = None
             self.leaf = False
             # compute lower-left-front corner
             # (to obtain child centerpoints more easily)
             dlf_point = self.center + Point(*[-self.width/2]*3)
-            # Splitting the containing oriented points
-            # split along yz (into top-bottom quadrants)
-            down_up = pts.split_along_plane(
-                self.center, 'xy')
-            for z, du in enumerate(down_up):
-                # and then along zx (into front-back pairs)
-                front_back = du.split_along_plane(
-                    self.center, 'xz')
-                for y, fb in enumerate(front_back):
-                    # and then along xy (into left and right cube)
-                    left_right = fb.split_along_plane(
-                        self.center, 'yz')
-                    for x, lr in enumerate(left_right):
+            # Splitting the containing oriented points:
+            # the octant of each point is x + 2y + 4z, where x, y, z
+            # are 0 below and 1 above the splitting planes.
+            # Sorting by octant once gives the contents of every child
+            # as a contiguous range of indices.
+            octant = (
+                (pts.positions[:, 0] >= self.center.x).astype(np.int64)
+                + 2 * (pts.positions[:, 1] >= self.center.y)
+                + 4 * (pts.positions[:, 2] >= self.center.z)
+            )
+            order = np.argsort(octant, kind='stable')
+            bounds = np.searchsorted(octant[order], np.arange(9))
+            for z in range(2):
+                for y in range(2):
+                    for x in range(2):
+                        k = x + 2 * y + 4 * z
+                        octant_order = order[bounds[k]:bounds[k+1]]
+                        lr = pts.take(octant_order)
                         # compute initialization parameters
                         # and instantiate new leaf nodes
                         child_depth = self.depth + 1
@@ -211,23 +693,29 @@ class Node:
                             child_center,
                             child_width,
                             lr,
-                            self
+                            self,
+                            indices=(None if indices is None
+                                     else indices[octant_order])
                         )
                         self.children.append(child_node)
                         # recursively subdivide:
                         if child_depth < max_depth:
-                            child_node.subdivide(max_depth)
+                            child_node.subdivide(max_depth, max_points,
+                                                 min_width)
 
-    def leaf_nodes(self, d):
+    def leaf_nodes(self, d=None):
         """
         Return all leaf nodes *of depth d* connected to this parent node
         (directly or further down the tree)
-        that contain at least one sample
+        that contain at least one sample.
+        With d=None, the leaf nodes of any depth are returned
+        (adaptive octrees).
         """
         node = self  # start here
         leaves = []  # instantiate an empty array
-        if node.leaf and node.depth == d:  # if it's already a leaf
-            if node.contents.points:  # if list of points is nonempty
+        # if it's already a leaf
+        if node.leaf and (d is None or node.depth == d):
+            if len(node.contents):  # if list of points is nonempty
                 leaves.append(self)
         else:
             # it's not a leaf. go down recursively and check the children
@@ -248,13 +736,22 @@ class Octree:
     Parameters:
         Points (Points): Points object
         depth (int): Maximum depth of the tree
+        max_points (int): (adaptive mode) do not subdivide nodes
+            holding at most this many samples
+        min_width (float): (adaptive mode) do not subdivide nodes
+            this wide or narrower
     Returns:
-        Octree object
+        Octree object. In adaptive mode, `leaf_nodes` holds the
+        non-empty leaves of all depths.
     """
     points: Oriented_Points
     depth: int
+    max_points: int = None
+    min_width: float = None
     head: Node = field(init=False)
     leaf_nodes: List[Node] = field(default_factory=list)
+    # factorizations of L, by ordering (see `L_factor`)
+    factors: dict = field(default_factory=dict, init=False, repr=False)
 
     def __post_init__(self):
         # instantiate the head node
@@ -264,11 +761,436 @@ class Octree:
             self.points.bbox_center(),
             max(self.points.bbox_dim()),
             self.points,
-            None
+            None,
+            indices=np.arange(len(self.points))
         )
         # subdivide `depth` times
-        self.head.subdivide(self.depth)
-        self.leaf_nodes = self.head.leaf_nodes(self.depth)
+        self.head.subdivide(self.depth, self.max_points, self.min_width)
+        if self.adaptive:
+            self.leaf_nodes = self.head.leaf_nodes(None)
+        else:
+            self.leaf_nodes = self.head.leaf_nodes(self.depth)
+
+    @property
+    def adaptive(self):
+        return self.max_points is not None or self.min_width is not None
+
+    @cached_property
+    def neighbours(self):
+        """
+        Neighbour index of the leaves, as CSR arrays
+        (see `leaf_neighbours`)
+        """
+        return leaf_neighbours(*leaf_arrays(self.leaf_nodes))
+
+    def L_factor(self, ordering: str = 'colamd'):
+        """
+        Factorization of L for the leaves (see `factorize_L`),
+        computed once per ordering and kept with the octree
+        """
+        if ordering not in self.factors:
+            self.factors[ordering] = factorize_L(
+                self.leaf_nodes, self.neighbours, ordering)
+        return self.factors[ordering]
+
+    def leaf_normal_sums(self, normals=None):
+        """
+        (N, 3) array with the sum of the normals of the samples of
+        each leaf. normals: (n, 3) array of new normals for the
+        points, in their original order (default: the normals of
+        `points`), e.g. after re-orienting them
+        """
+        if normals is None:
+            normals = self.points.normals
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        if not self.leaf_nodes:
+            return np.zeros((0, 3))
+        indices = [o.indices for o in self.leaf_nodes]
+        starts = np.cumsum([0] + [len(i) for i in indices[:-1]])
+        return np.add.reduceat(normals[np.concatenate(indices)],
+                               starts, axis=0)
+
+
+"""
+Linear octree: the nodes are identified by their Morton code
+(interleaved bits of the integer cell coordinates, x lowest),
+so that sorting the points by code once groups the contents of every
+node, at every depth, in a contiguous range.
+The child index x + 2y + 4z used by `Node.subdivide` is exactly one
+octal digit of the code: the nodes come out in the same order as
+`Node.leaf_nodes`.
+"""
+
+MORTON_MAX_DEPTH = 21  # 3 x 21 bits fit in a 64-bit code
+
+
+def morton_spread(v):
+    """
+    Insert two zero bits between each bit of the (21-bit) integers v
+    """
+    v = v.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_compact(v):
+    """
+    Inverse of `morton_spread`: keep every third bit of v
+    """
+    v = v.astype(np.uint64) & np.uint64(0x1249249249249249)
+    v = (v | v >> np.uint64(2)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v >> np.uint64(4)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v >> np.uint64(8)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v >> np.uint64(16)) & np.uint64(0x1f00000000ffff)
+    v = (v | v >> np.uint64(32)) & np.uint64(0x1fffff)
+    return v.astype(np.int64)
+
+
+def morton_encode(ix, iy, iz):
+    """
+    Morton codes of the integer cell coordinates (ix, iy, iz)
+    """
+    return (morton_spread(ix)
+            | morton_spread(iy) << np.uint64(1)
+            | morton_spread(iz) << np.uint64(2))
+
+
+def morton_decode(codes):
+    """
+    Integer cell coordinates (ix, iy, iz) of Morton codes
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    return (morton_compact(codes),
+            morton_compact(codes >> np.uint64(1)),
+            morton_compact(codes >> np.uint64(2)))
+
+
+@dataclass
+class Linear_Octree:
+    """
+    Octree spatial partition, stored as flat arrays.
+    Same partition as `Octree`, built by sorting the points
+    by Morton code once instead of recursive splitting.
+    Parameters:
+        points (Oriented_Points): Points object
+        depth (int): Maximum depth of the tree (at most 21)
+        max_points, min_width: adaptive mode, as in `Octree`
+    Returns:
+        Linear_Octree object. The non-empty nodes of all depths are
+        stored in the arrays `codes`, `depths`, `starts` and `ends`
+        (range of the node in the sorted points), depth by depth and
+        in Morton order within a depth. The nodes of depth d are
+        those in `level_offsets[d]:level_offsets[d+1]`.
+        `leaves` holds the indices of the leaf nodes, in Morton order.
+    """
+    points: Oriented_Points
+    depth: int
+    max_points: int = None
+    min_width: float = None
+    head: Node = field(init=False)
+    # points sorted by Morton code, and the permutation that sorts them
+    sorted_points: Oriented_Points = field(init=False)
+    order: np.ndarray = field(init=False)
+    codes: np.ndarray = field(init=False)
+    depths: np.ndarray = field(init=False)
+    starts: np.ndarray = field(init=False)
+    ends: np.ndarray = field(init=False)
+    level_offsets: np.ndarray = field(init=False)
+    leaves: np.ndarray = field(init=False)
+    # factorizations of L, by ordering (see `L_factor`)
+    factors: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if not 0 <= self.depth <= MORTON_MAX_DEPTH:
+            raise ValueError('Depth must be between 0 and '
+                             + str(MORTON_MAX_DEPTH))
+        self.head = Node(
+            0,
+            self.depth == 0,
+            self.points.bbox_center(),
+            max(self.points.bbox_dim()),
+            self.points,
+            None
+        )
+        # integer coordinates of the cells of the finest depth
+        n_cells = 2**self.depth
+        origin = np.array([self.head.center.x,
+                           self.head.center.y,
+                           self.head.center.z]) - self.head.width/2.00
+        cells = np.floor((self.points.positions - origin)
+                         / (self.head.width / n_cells)).astype(np.int64)
+        np.clip(cells, 0, n_cells - 1, out=cells)
+        point_codes = morton_encode(cells[:, 0], cells[:, 1], cells[:, 2])
+        del cells
+        # the one and only sort
+        self.order = np.argsort(point_codes, kind='stable')
+        point_codes = point_codes[self.order]
+        self.sorted_points = self.points.take(self.order)
+        # nodes, depth by depth: the code of the ancestor at depth d
+        # is the code at the finest depth without its last digits
+        codes, depths, starts = [], [], []
+        for d in range(self.depth + 1):
+            shift = np.uint64(3 * (self.depth - d))
+            level_codes = point_codes >> shift
+            first = np.flatnonzero(np.concatenate((
+                [True], level_codes[1:] != level_codes[:-1])))
+            codes.append(level_codes[first])
+            depths.append(np.full(len(first), d))
+            starts.append(first)
+        self.level_offsets = np.cumsum([0] + [len(c) for c in codes])
+        self.codes = np.concatenate(codes)
+        self.depths = np.concatenate(depths)
+        self.starts = np.concatenate(starts)
+        # a node ends where the next one (of the same depth) starts
+        self.ends = np.empty_like(self.starts)
+        for d in range(self.depth + 1):
+            level = self.level(d)
+            self.ends[level] = np.append(self.starts[level][1:],
+                                         len(point_codes))
+        self.leaves = self._find_leaves()
+
+    @property
+    def adaptive(self):
+        return self.max_points is not None or self.min_width is not None
+
+    def _find_leaves(self):
+        """
+        Indices of the leaf nodes. Without adaptive mode these are
+        the nodes of the finest depth. Otherwise, a node is a leaf if
+        it is small enough (samples or width) while none of its
+        ancestors is.
+        """
+        if not self.adaptive:
+            return np.arange(self.level_offsets[self.depth],
+                             self.level_offsets[self.depth + 1])
+        stop = self.depths == self.depth
+        if self.max_points is not None:
+            stop |= (self.ends - self.starts) <= self.max_points
+        if self.min_width is not None:
+            stop |= self.head.width / 2.00**self.depths <= self.min_width
+        # below a leaf: one of the ancestors stopped
+        below = np.zeros(len(self.codes), dtype=bool)
+        for d in range(1, self.depth + 1):
+            level = self.level(d)
+            parent_level = self.level(d - 1)
+            parents = parent_level.start + np.searchsorted(
+                self.starts[parent_level], self.starts[level],
+                side='right') - 1
+            below[level] = below[parents] | stop[parents]
+        leaves = np.flatnonzero(stop & ~below)
+        # leaves partition the points: order them like the points
+        return leaves[np.argsort(self.starts[leaves], kind='stable')]
+
+    @cached_property
+    def neighbours(self):
+        """
+        Neighbour index of the leaves, as CSR arrays
+        (see `leaf_neighbours`)
+        """
+        return leaf_neighbours(self.node_centers(self.leaves),
+                               self.node_widths(self.leaves))
+
+    def L_factor(self, ordering: str = 'colamd'):
+        """
+        Factorization of L for the leaves (see `factorize_L`),
+        computed once per ordering and kept with the octree
+        """
+        if ordering not in self.factors:
+            self.factors[ordering] = factorize_L(
+                self.leaf_nodes, self.neighbours, ordering)
+        return self.factors[ordering]
+
+    def leaf_normal_sums(self, normals=None):
+        """
+        (N, 3) array with the sum of the normals of the samples of
+        each leaf. normals: (n, 3) array of new normals for the
+        points, in their original order (default: the normals of
+        `points`), e.g. after re-orienting them
+        """
+        if normals is None:
+            normals = self.points.normals
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        return np.add.reduceat(normals[self.order],
+                               self.starts[self.leaves], axis=0)
+
+    @cached_property
+    def leaf_nodes(self):
+        """
+        `Node` objects of the leaves, built on first access only
+        (the arrays are all that is needed to build the tree)
+        """
+        return self.build_nodes(self.leaves)
+
+    def level(self, d):
+        """
+        Slice of the node arrays holding the nodes of depth d
+        """
+        return slice(self.level_offsets[d], self.level_offsets[d+1])
+
+    def widths(self, d):
+        """
+        Widths of the nodes of depth d
+        """
+        return self.node_widths(self.level(d))
+
+    def centers(self, d):
+        """
+        (n, 3) array with the centers of the nodes of depth d
+        """
+        return self.node_centers(self.level(d))
+
+    def node_widths(self, indices):
+        """
+        Widths of the given nodes
+        """
+        return self.head.width / 2.00**self.depths[indices]
+
+    def node_centers(self, indices):
+        """
+        (n, 3) array with the centers of the given nodes
+        """
+        ix, iy, iz = morton_decode(self.codes[indices])
+        width = self.node_widths(indices)[:, np.newaxis]
+        origin = np.array([self.head.center.x,
+                           self.head.center.y,
+                           self.head.center.z]) - self.head.width/2.00
+        return origin + (np.column_stack((ix, iy, iz)) + 0.50) * width
+
+    def contents(self, i):
+        """
+        Oriented points contained in the i-th node
+        (views into `sorted_points`)
+        """
+        s, e = self.starts[i], self.ends[i]
+        return Oriented_Points(self.sorted_points.positions[s:e],
+                               self.sorted_points.normals[s:e])
+
+    def nodes(self, d):
+        """
+        `Node` objects for the (non-empty) nodes of depth d,
+        to use with the functions that take a list of leaf nodes
+        """
+        level = self.level(d)
+        return self.build_nodes(np.arange(level.start, level.stop))
+
+    def build_nodes(self, indices):
+        """
+        `Node` objects for the given nodes (no parents or children)
+        """
+        is_leaf = np.zeros(len(self.codes), dtype=bool)
+        is_leaf[self.leaves] = True
+        return [
+            Node(d, leaf, Point(*center), width, self.contents(i), None)
+            for i, d, leaf, center, width in zip(
+                indices.tolist(),
+                self.depths[indices].tolist(),
+                is_leaf[indices].tolist(),
+                self.node_centers(indices).tolist(),
+                self.node_widths(indices).tolist())
+        ]
+
+
+"""
+Neighbour index of the leaves
+
+The basis function of a leaf of width w centered at c is supported
+on the cube of side 3w around c, so two leaves interact only if
+|c - c'| < 3(w + w')/2 along every axis: at most 5x5x5 leaves of
+the same depth, and a few more of other depths.
+"""
+
+
+def leaf_arrays(leaf_nodes: List[Node]):
+    """
+    (N, 3) array of the centers and (N,) array of the widths
+    of a list of leaf nodes
+    """
+    centers = np.array([[o.center.x, o.center.y, o.center.z]
+                        for o in leaf_nodes]).reshape(-1, 3)
+    widths = np.array([o.width for o in leaf_nodes], dtype=np.float64)
+    return centers, widths
+
+
+def leaf_neighbours(centers, widths, chunk_size=16384):
+    """
+    For every leaf, the leaves whose basis function supports
+    intersect (the leaf itself included).
+    Leaves of each width are located with integer cell coordinates
+    and a sorted-key lookup: each leaf only looks at the few cells
+    of its own or a coarser depth that can reach it, the pairs with
+    finer leaves are obtained by symmetry.
+    Returns CSR arrays (indptr, indices): the neighbours of leaf i
+    are indices[indptr[i]:indptr[i+1]], in increasing order.
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    widths = np.asarray(widths, dtype=np.float64)
+    n = len(widths)
+    if n == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # one lattice per width, coarsest first. The corner of a coarsest
+    # leaf is a node of all the (finer) lattices.
+    level_widths = np.unique(widths)[::-1]
+    levels = [np.flatnonzero(widths == w) for w in level_widths]
+    first = levels[0][0]
+    origin = centers[first] - widths[first] / 2.00
+    cells = [np.rint((centers[level] - origin) / w - 0.50).astype(np.int64)
+             for level, w in zip(levels, level_widths)]
+    rows, cols = [], []
+    for b, (targets, wb) in enumerate(zip(levels, level_widths)):
+        # sorted keys of the cells of the targets
+        lo = cells[b].min(axis=0)
+        dims = cells[b].max(axis=0) - lo + 1
+        keys = np.ravel_multi_index(tuple((cells[b] - lo).T), dims)
+        by_key = np.argsort(keys)
+        keys = keys[by_key]
+        # queries: leaves of the same width or finer
+        for a in range(b, len(levels)):
+            s = int(round(wb / level_widths[a]))
+            # target cells j overlapping query cell i, per axis:
+            # |(j + 1/2) s - (i + 1/2)| < 3 (1 + s) / 2
+            i = cells[a]
+            j_lo = (i - 1 - 2 * s) // s + 1
+            j_hi = -((-(i + 2 + s)) // s) - 1
+            m = int((j_hi - j_lo).max()) + 1
+            offsets = np.stack(np.meshgrid(
+                np.arange(m), np.arange(m), np.arange(m),
+                indexing='ij'), axis=-1).reshape(-1, 3)
+            for start in range(0, len(i), chunk_size):
+                stop = min(start + chunk_size, len(i))
+                candidates = (j_lo[start:stop, np.newaxis, :]
+                              + offsets[np.newaxis, :, :])
+                valid = np.all(
+                    (candidates <= j_hi[start:stop, np.newaxis, :])
+                    & (candidates >= lo) & (candidates < lo + dims),
+                    axis=2)
+                query, slot = np.nonzero(valid)
+                candidate_keys = np.ravel_multi_index(
+                    tuple((candidates[query, slot] - lo).T), dims)
+                pos = np.searchsorted(keys, candidate_keys)
+                pos[pos == len(keys)] = 0
+                found = keys[pos] == candidate_keys
+                q = levels[a][start + query[found]]
+                t = targets[by_key[pos[found]]]
+                rows.append(q)
+                cols.append(t)
+                if a != b:
+                    # symmetric pairs (finer target, coarser query)
+                    rows.append(t)
+                    cols.append(q)
+    # note: the test is exact (integer arithmetic). Supports that
+    # only touch are not neighbours, while `domain` may see a domain
+    # of zero width, up to rounding errors.
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    order = np.argsort(rows * n + cols)
+    indices = cols[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, indices
 
 
 """
@@ -348,38 +1270,235 @@ def domain(oc, ow, ocp, owp):
     return (minimum, maximum)
 
 
-def v(leaf_nodes: List[Node]):
-    """
-    Computes and returns the vector `v`
-    """
-    v_vec = np.full(len(leaf_nodes), 0.00)
-    for i, o in enumerate(tqdm(leaf_nodes)):
-        value = 0.00  # initialize
-        for op in leaf_nodes:
-            if not op.contents:  # if the considered leaf is empty, skip
-                break
-            # it's not empty!
-            aoop = 1/(o.width**3)*1/(op.width**5) * np.power(2*np.pi, -3.00)
-            # note: If all nodes have the same depth and width,
-            # this will always be the same...
-            xmin, xmax = domain(o.center.x, o.width, op.center.x, op.width)
-            ymin, ymax = domain(o.center.y, o.width, op.center.y, op.width)
-            zmin, zmax = domain(o.center.z, o.width, op.center.z, op.width)
-            # check for nonempty integration domain
-            exists = (xmin < xmax and ymin < ymax and zmin < zmax)
-            if exists:
-                # add the contribution of each sample
-                # `s` that's inside leaf `op`
-                for s in op.contents.points:
-                    value += aoop * \
-                        I1oop(xmin, xmax, ymin, ymax, zmin, zmax,
-                              o.center.x, o.center.y, o.center.z,
-                              op.center.x, op.center.y, op.center.z,
-                              s.nx, s.ny, s.nz)
+"""
+Separable integrals
+
+The integrands of `I1oop` and `I2oop` are polynomials of degree 3
+and 2 in q = (x, y, z):
+    I1oop: (1 - |q - oc|^2 / 2) ((ocp - q) . sn)
+    I2oop: |q - ocp|^2 / (2 ow^2) - 1
+so over a box they are short sums of products of 1D integrals
+(moments along each axis), instead of the antiderivatives `A`/`B`
+at the eight corners. The batched kernels below take (n, 3) arrays
+of domains (lower and upper corners) and return n integrals.
+Empty domains give zero.
+"""
+
+
+@jit(nopython=True)
+def axis_moments(a, b, c):
+    """
+    Low-level function.
+    Integrals of 1, u, u^2, u^3 over [a, b], where u = t - c
+    """
+    ua = a - c
+    ub = b - c
+    return (ub - ua,
+            (ub**2 - ua**2) / 2.0,
+            (ub**3 - ua**3) / 3.0,
+            (ub**4 - ua**4) / 4.0)
+
+
+@jit(nopython=True)
+def I1oop_box(xmin, xmax, ymin, ymax, zmin, zmax,
+              ocx, ocy, ocz, ocpx, ocpy, ocpz, snx, sny, snz):
+    """
+    Low-level function.
+    Separable `I1oop` for one (non-empty) box
+    """
+    m = np.empty((3, 4))
+    m[0, 0], m[0, 1], m[0, 2], m[0, 3] = axis_moments(xmin, xmax, ocx)
+    m[1, 0], m[1, 1], m[1, 2], m[1, 3] = axis_moments(ymin, ymax, ocy)
+    m[2, 0], m[2, 1], m[2, 2], m[2, 3] = axis_moments(zmin, zmax, ocz)
+    d = (ocpx - ocx, ocpy - ocy, ocpz - ocz)
+    sn = (snx, sny, snz)
+    value = 0.0
+    for a in range(3):
+        b = (a + 1) % 3
+        c = (a + 2) % 3
+        # integral of (ocp_a - q_a), and of u_a^2 (ocp_a - q_a),
+        # along axis a
+        linear = d[a] * m[a, 0] - m[a, 1]
+        cubic = d[a] * m[a, 2] - m[a, 3]
+        value += sn[a] * (
+            linear * m[b, 0] * m[c, 0]
+            - 0.5 * (cubic * m[b, 0] * m[c, 0]
+                     + linear * (m[b, 2] * m[c, 0]
+                                 + m[b, 0] * m[c, 2])))
+    return value
+
+
+@jit(nopython=True, parallel=True)
+def I1oop_separable(lo, hi, oc, ocp, sn):
+    """
+    Batched `I1oop` over the boxes lo[k] - hi[k]
+    (oc, ocp, sn: (n, 3) arrays)
+    """
+    n = len(lo)
+    result = np.zeros(n)
+    for k in prange(n):
+        if not (lo[k, 0] < hi[k, 0] and lo[k, 1] < hi[k, 1]
+                and lo[k, 2] < hi[k, 2]):
+            continue
+        result[k] = I1oop_box(lo[k, 0], hi[k, 0], lo[k, 1], hi[k, 1],
+                              lo[k, 2], hi[k, 2],
+                              oc[k, 0], oc[k, 1], oc[k, 2],
+                              ocp[k, 0], ocp[k, 1], ocp[k, 2],
+                              sn[k, 0], sn[k, 1], sn[k, 2])
+    return result
+
+
+@jit(nopython=True)
+def I2oop_box(xmin, xmax, ymin, ymax, zmin, zmax, ocpx, ocpy, ocpz, ow):
+    """
+    Low-level function.
+    Separable `I2oop` for one (non-empty) box
+    """
+    x0, _, x2, _ = axis_moments(xmin, xmax, ocpx)
+    y0, _, y2, _ = axis_moments(ymin, ymax, ocpy)
+    z0, _, z2, _ = axis_moments(zmin, zmax, ocpz)
+    return (x2 * y0 * z0 + x0 * y2 * z0 + x0 * y0 * z2) \
+        / (2.0 * ow**2) - x0 * y0 * z0
+
+
+@jit(nopython=True, parallel=True)
+def I2oop_separable(lo, hi, ocp, ow):
+    """
+    Batched `I2oop` over the boxes lo[k] - hi[k]
+    (ocp: (n, 3) array, ow: (n,) array)
+    """
+    n = len(lo)
+    result = np.zeros(n)
+    for k in prange(n):
+        if not (lo[k, 0] < hi[k, 0] and lo[k, 1] < hi[k, 1]
+                and lo[k, 2] < hi[k, 2]):
+            continue
+        result[k] = I2oop_box(lo[k, 0], hi[k, 0], lo[k, 1], hi[k, 1],
+                              lo[k, 2], hi[k, 2],
+                              ocp[k, 0], ocp[k, 1], ocp[k, 2], ow[k])
+    return result
+
+
+def pair_domains(centers, widths, rows, cols):
+    """
+    (n, 3) arrays of the lower and upper corners of the domains of
+    integration of the pairs of leaves (rows[k], cols[k])
+    (see `domain`)
+    """
+    half_rows = 3.0 * widths[rows, np.newaxis] / 2.0
+    half_cols = 3.0 * widths[cols, np.newaxis] / 2.0
+    lo = np.maximum(centers[rows] - half_rows, centers[cols] - half_cols)
+    hi = np.minimum(centers[rows] + half_rows, centers[cols] + half_cols)
+    return lo, hi
+
+
+def neighbour_rows(indptr):
+    """
+    Row index of every entry of a CSR neighbour index
+    """
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+@contextmanager
+def kernel_threads(threads: int = None):
+    """
+    Runs the parallel (numba) kernels of the block on `threads`
+    threads; None keeps the current setting (all the cores, unless
+    changed with `numba.set_num_threads` or NUMBA_NUM_THREADS).
+    The results do not depend on the number of threads.
+    """
+    if threads is None:
+        yield
+        return
+    previous = numba.get_num_threads()
+    numba.set_num_threads(threads)
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous)
+
+
+def leaf_normal_sums(leaf_nodes: List[Node]):
+    """
+    (N, 3) array with the sum of the normals of the samples
+    contained in each leaf
+    """
+    normal_sums = np.zeros((len(leaf_nodes), 3))
+    for i, o in enumerate(leaf_nodes):
+        if len(o.contents):
+            normal_sums[i] = o.contents.normals.sum(axis=0)
+    return normal_sums
+
+
+@jit(nopython=True)
+def v_entry(centers, widths, normal_sums, i, j):
+    """
+    Low-level function.
+    Contribution of the samples of leaf j to the entry i of `v`
+    """
+    ow = widths[i]
+    owp = widths[j]
+    xmin, xmax = domain(centers[i, 0], ow, centers[j, 0], owp)
+    ymin, ymax = domain(centers[i, 1], ow, centers[j, 1], owp)
+    zmin, zmax = domain(centers[i, 2], ow, centers[j, 2], owp)
+    # check for nonempty integration domain
+    if not (xmin < xmax and ymin < ymax and zmin < zmax):
+        return 0.0
+    aoop = 1/(ow**3)*1/(owp**5) * np.power(2*np.pi, -3.00)
+    return aoop * I1oop_box(xmin, xmax, ymin, ymax, zmin, zmax,
+                            centers[i, 0], centers[i, 1], centers[i, 2],
+                            centers[j, 0], centers[j, 1], centers[j, 2],
+                            normal_sums[j, 0], normal_sums[j, 1],
+                            normal_sums[j, 2])
+
+
+@jit(nopython=True, parallel=True)
+def v_values(centers, widths, normal_sums, indptr, indices):
+    """
+    Low-level function. Used in `v`.
+    The integrand of `I1oop` is linear in the sample normal, so the
+    samples of a leaf contribute once, with their summed normal.
+    Parallel over the leaves; every entry is summed in the order of
+    the neighbour index, whatever the number of threads.
+    """
+    n = len(indptr) - 1
+    v_vec = np.zeros(n)
+    for i in prange(n):
+        value = 0.0
+        for k in range(indptr[i], indptr[i+1]):
+            value += v_entry(centers, widths, normal_sums, i, indices[k])
         v_vec[i] = value
     return v_vec
 
 
+def v(leaf_nodes: List[Node], neighbours=None, normal_sums=None,
+      threads: int = None):
+    """
+    Computes and returns the vector `v`.
+    neighbours: neighbour index of the leaves (`leaf_neighbours`),
+    computed if not given
+    normal_sums: summed normals of the leaves (`leaf_normal_sums`),
+    computed if not given
+    threads: number of threads of the kernels (default: all)
+    The cost does not depend on the number of samples per leaf.
+    Leaves of a single depth use the stencil tables.
+    """
+    centers, widths = leaf_arrays(leaf_nodes)
+    if neighbours is None:
+        neighbours = leaf_neighbours(centers, widths)
+    if normal_sums is None:
+        normal_sums = leaf_normal_sums(leaf_nodes)
+    indptr, indices = neighbours
+    w = uniform_width(widths)
+    with kernel_threads(threads):
+        if w is not None:
+            # uniform depth: gather from the stencil table
+            _, v_table = stencil_tables(w)
+            return stencil_v_values(centers, w, v_table, normal_sums,
+                                    indptr, indices)
+        return v_values(centers, widths, normal_sums, indptr, indices)
+
+
 @jit(nopython=True)
 def B(x, y, z, ocpx, ocpy, ocpz, ow):
     """
@@ -419,41 +1538,461 @@ def I2oop(xmin, xmax, ymin, ymax, zmin, zmax,
 
 
 
-def L(leaf_nodes: List[Node]):
+def L(leaf_nodes: List[Node], neighbours=None, threads: int = None):
+    """
+    Computes and returns the matrix `L` (dense).
+    neighbours: neighbour index of the leaves (`leaf_neighbours`),
+    computed if not given
+    threads: number of threads of the kernels (default: all)
+    """
+    return L_sparse(leaf_nodes, neighbours, threads=threads).toarray()
+
+
+@jit(nopython=True)
+def L_entry(centers, widths, i, j):
+    """
+    Low-level function.
+    Entry (i, j) of the matrix L
+    """
+    ow = widths[i]
+    owp = widths[j]
+    xmin, xmax = domain(centers[i, 0], ow, centers[j, 0], owp)
+    ymin, ymax = domain(centers[i, 1], ow, centers[j, 1], owp)
+    zmin, zmax = domain(centers[i, 2], ow, centers[j, 2], owp)
+    # check for nonempty integration domain
+    if not (xmin < xmax and ymin < ymax and zmin < zmax):
+        return 0.0
+    aoop = 1/(ow**5)*1/(owp**3) * np.power(2*np.pi, -3.00)
+    return 3.00 * aoop * I2oop_box(xmin, xmax, ymin, ymax, zmin, zmax,
+                                   centers[j, 0], centers[j, 1],
+                                   centers[j, 2], owp)
+
+
+@jit(nopython=True)
+def find_in_row(indptr, indices, i, j):
+    """
+    Low-level function.
+    Position of column j in row i of sorted CSR arrays (-1 if absent)
+    """
+    lo, hi = indptr[i], indptr[i+1]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if indices[mid] < j:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < indptr[i+1] and indices[lo] == j:
+        return lo
+    return -1
+
+
+@jit(nopython=True, parallel=True)
+def L_values(centers, widths, indptr, indices):
     """
-    Computes and returns the matrix `L`
+    Low-level function. Used in `L_sparse`.
+    Entries of the matrix L for the (row, column) pairs of the
+    neighbour index: the triplets are (i, indices[k], values[k])
+    for indptr[i] <= k < indptr[i+1].
+    L is symmetric for pairs of leaves of the same width: row i
+    computes these for j >= i only, and writes the mirrored entry
+    (j, i) too. Parallel over the rows, every entry is written by
+    a single thread.
     """
-    L_mat = np.full((len(leaf_nodes), len(leaf_nodes)), 0.00)  # initialize
-    for i, o in enumerate(tqdm(leaf_nodes)):
-        # for j in range(i, len(leaf_nodes)):
-        for j in range(len(leaf_nodes)):
-            op = leaf_nodes[j]
-            value = 0.00  # initialize
-            aoop = 1/(o.width**5)*1/(op.width**3) * \
-                np.power(2*np.pi, -3.00)
-            xmin, xmax = domain(o.center.x, o.width, op.center.x, op.width)
-            ymin, ymax = domain(o.center.y, o.width, op.center.y, op.width)
-            zmin, zmax = domain(o.center.z, o.width, op.center.z, op.width)
-            # check for nonempty integration domain
-            exists = (xmin < xmax and ymin < ymax and zmin < zmax)
-            if exists:
-                value += 3.00 * aoop * \
-                    I2oop(xmin, xmax, ymin, ymax, zmin, zmax,
-                          op.center.x, op.center.y, op.center.z, op.width)
-            L_mat[i, j] = value
-            # if i > j:
-            #     L_mat[j, i] = value
-    return L_mat
+    n = len(indptr) - 1
+    values = np.zeros(len(indices))
+    for i in prange(n):
+        for k in range(indptr[i], indptr[i+1]):
+            j = indices[k]
+            same = widths[j] == widths[i]
+            if same and j < i:
+                continue  # written by row j
+            value = L_entry(centers, widths, i, j)
+            values[k] = value
+            if same and j > i:
+                mirror = find_in_row(indptr, indices, j, i)
+                if mirror >= 0:
+                    values[mirror] = value
+    return values
 
 
-def solve_for_x(leaf_nodes: List[Node]):
+def L_sparse(leaf_nodes: List[Node], neighbours=None,
+             symmetric: bool = False, threads: int = None):
+    """
+    Computes and returns the matrix `L` as a sparse CSR matrix,
+    holding only the entries of overlapping leaves
+    (memory linear in the number of leaves).
+    Leaves of a single depth use the stencil tables.
+    neighbours: neighbour index of the leaves (`leaf_neighbours`),
+    computed if not given
+    symmetric: return only the upper triangle (diagonal included),
+    half the memory. Only for leaves of a single depth: with leaves
+    of different widths L is not symmetric.
+    See `johnvm.solvers.Symmetric_Matrix` to use it as a matrix.
+    threads: number of threads of the kernels (default: all)
+    """
+    centers, widths = leaf_arrays(leaf_nodes)
+    if neighbours is None:
+        neighbours = leaf_neighbours(centers, widths)
+    indptr, indices = neighbours
+    n = len(leaf_nodes)
+    w = uniform_width(widths)
+    if symmetric:
+        if w is None and n:
+            raise ValueError('L is only symmetric for leaves '
+                             'of a single depth')
+        rows = neighbour_rows(indptr)
+        upper = rows <= indices
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[upper], minlength=n), out=indptr[1:])
+        indices = indices[upper]
+    with kernel_threads(threads):
+        if w is not None:
+            # uniform depth: gather from the stencil table
+            L_table, _ = stencil_tables(w)
+            values = stencil_L_values(centers, w, L_table,
+                                      indptr, indices)
+        else:
+            values = L_values(centers, widths, indptr, indices)
+    return sparse.csr_matrix((values, indices, indptr), shape=(n, n))
+
+
+"""
+Matrix-free operator
+
+The products with L are computed on the fly from the neighbour
+index, so that L is never stored: only the leaf arrays and the
+neighbour index are kept in memory.
+"""
+
+
+@jit(nopython=True, parallel=True)
+def stencil_matvec(centers, w, table, indptr, indices, x):
+    """
+    Low-level function. Used in `Poisson_Operator`.
+    L @ x for leaves of a single width w (table: `stencil_tables`)
+    """
+    n = len(indptr) - 1
+    y = np.zeros(n)
+    for i in prange(n):
+        value = 0.0
+        for k in range(indptr[i], indptr[i+1]):
+            j = indices[k]
+            a, b, c = stencil_offset(centers, w, i, j)
+            value += table[a, b, c] * x[j]
+        y[i] = value
+    return y
+
+
+@jit(nopython=True, parallel=True)
+def L_matvec(centers, widths, indptr, indices, x):
+    """
+    Low-level function. Used in `Poisson_Operator`.
+    L @ x for leaves of any width (separable integrals)
+    """
+    n = len(indptr) - 1
+    y = np.zeros(n)
+    for i in prange(n):
+        value = 0.0
+        for k in range(indptr[i], indptr[i+1]):
+            j = indices[k]
+            value += L_entry(centers, widths, i, j) * x[j]
+        y[i] = value
+    return y
+
+
+class Poisson_Operator(scipy.sparse.linalg.LinearOperator):
+    """
+    Matrix-free L: `L @ x` evaluates the integrals on the fly
+    (parallel numba kernels), from the stencil tables for leaves of
+    a single depth. Memory: the neighbour index only.
+    Can be passed to the iterative solvers of `johnvm.solvers`.
+    """
+
+    def __init__(self, leaf_nodes: List[Node], neighbours=None):
+        self.centers, self.widths = leaf_arrays(leaf_nodes)
+        if neighbours is None:
+            neighbours = leaf_neighbours(self.centers, self.widths)
+        self.indptr, self.indices = neighbours
+        self.width = uniform_width(self.widths)
+        self.table = None
+        if self.width is not None:
+            self.table, _ = stencil_tables(self.width)
+        n = len(self.widths)
+        super().__init__(dtype=np.float64, shape=(n, n))
+
+    def _matvec(self, x):
+        x = np.ascontiguousarray(np.ravel(x), dtype=np.float64)
+        if self.table is not None:
+            return stencil_matvec(self.centers, self.width, self.table,
+                                  self.indptr, self.indices, x)
+        return L_matvec(self.centers, self.widths,
+                        self.indptr, self.indices, x)
+
+    def diagonal(self):
+        if self.table is not None:
+            return np.full(self.shape[0], self.table[(STENCIL_RADIUS,)*3])
+        n = self.shape[0]
+        return L_values(self.centers, self.widths,
+                        np.arange(n + 1), np.arange(n))
+
+
+def is_symmetric(leaf_nodes: List[Node]):
+    """
+    Is L symmetric? (leaves of a single depth)
+    """
+    return uniform_width(leaf_arrays(leaf_nodes)[1]) is not None
+
+
+"""
+Stencil tables for uniform-depth leaves
+
+When all the leaves have the same width w, an entry of L, and the
+contribution of a normal component to v, only depend on the integer
+offset between the two cells (in -2..2 along every axis: the
+supports intersect). They are computed once with `I2oop`/`I1oop`,
+and the assembly is a lookup by offset.
+"""
+
+STENCIL_RADIUS = 2
+
+
+def uniform_width(widths):
+    """
+    The common width of the leaves, or None if they differ
+    """
+    if len(widths) and np.all(widths == widths[0]):
+        return float(widths[0])
+    return None
+
+
+def stencil_tables(w: float):
+    """
+    Returns the tables of L (5, 5, 5) and of v (5, 5, 5, 3)
+    for leaves of width w, indexed by the offset of cell `op`
+    relative to cell `o` (plus STENCIL_RADIUS).
+    The last axis of the v table is the normal component.
+    Computed around the origin: translating both cells does not
+    change the integrals (and avoids cancellation errors).
+    """
+    size = 2 * STENCIL_RADIUS + 1
+    L_table = np.zeros((size, size, size))
+    v_table = np.zeros((size, size, size, 3))
+    aoop = 1/(w**5)*1/(w**3) * np.power(2*np.pi, -3.00)
+    for a in range(size):
+        for b in range(size):
+            for c in range(size):
+                cp = (np.array([a, b, c]) - STENCIL_RADIUS) * w
+                xmin, xmax = domain(0.00, w, cp[0], w)
+                ymin, ymax = domain(0.00, w, cp[1], w)
+                zmin, zmax = domain(0.00, w, cp[2], w)
+                if not (xmin < xmax and ymin < ymax and zmin < zmax):
+                    continue
+                mirror = (size - 1 - a, size - 1 - b, size - 1 - c)
+                if mirror < (a, b, c):
+                    # L is symmetric: L(-offset) = L(offset)
+                    L_table[a, b, c] = L_table[mirror]
+                else:
+                    L_table[a, b, c] = 3.00 * aoop * \
+                        I2oop(xmin, xmax, ymin, ymax, zmin, zmax,
+                              cp[0], cp[1], cp[2], w)
+                for k, (snx, sny, snz) in enumerate(np.eye(3)):
+                    v_table[a, b, c, k] = aoop * \
+                        I1oop(xmin, xmax, ymin, ymax, zmin, zmax,
+                              0.00, 0.00, 0.00, cp[0], cp[1], cp[2],
+                              snx, sny, snz)
+    return L_table, v_table
+
+
+@jit(nopython=True)
+def stencil_offset(centers, w, i, j):
+    """
+    Low-level function.
+    Integer offset (plus STENCIL_RADIUS) of cell j relative to cell i:
+    the index in the stencil tables
+    """
+    a = int(np.rint((centers[j, 0] - centers[i, 0]) / w)) + STENCIL_RADIUS
+    b = int(np.rint((centers[j, 1] - centers[i, 1]) / w)) + STENCIL_RADIUS
+    c = int(np.rint((centers[j, 2] - centers[i, 2]) / w)) + STENCIL_RADIUS
+    size = 2 * STENCIL_RADIUS + 1
+    if not (0 <= a < size and 0 <= b < size and 0 <= c < size):
+        raise ValueError('Neighbours further apart than the stencil')
+    return a, b, c
+
+
+@jit(nopython=True, parallel=True)
+def stencil_L_values(centers, w, table, indptr, indices):
+    """
+    Low-level function. Used in `L_sparse`.
+    Same as `L_values`, for leaves of a single width w
+    (table: L table of `stencil_tables`)
+    """
+    n = len(indptr) - 1
+    values = np.zeros(len(indices))
+    for i in prange(n):
+        for k in range(indptr[i], indptr[i+1]):
+            a, b, c = stencil_offset(centers, w, i, indices[k])
+            values[k] = table[a, b, c]
+    return values
+
+
+@jit(nopython=True, parallel=True)
+def stencil_v_values(centers, w, table, normal_sums, indptr, indices):
+    """
+    Low-level function. Used in `v`.
+    Same as `v_values`, for leaves of a single width w
+    (table: v table of `stencil_tables`)
+    """
+    n = len(indptr) - 1
+    v_vec = np.zeros(n)
+    for i in prange(n):
+        value = 0.0
+        for k in range(indptr[i], indptr[i+1]):
+            j = indices[k]
+            a, b, c = stencil_offset(centers, w, i, j)
+            value += table[a, b, c, 0] * normal_sums[j, 0] \
+                + table[a, b, c, 1] * normal_sums[j, 1] \
+                + table[a, b, c, 2] * normal_sums[j, 2]
+        v_vec[i] = value
+    return v_vec
+
+
+"""
+Factorization of L, reused for several right-hand sides
+(the geometry, hence L, is fixed while the normals change)
+"""
+
+ORDERINGS = ('colamd', 'rcm', 'morton')
+
+# solvers and preconditioners of `johnvm.solvers` that do not work
+# on L (indefinite)
+POSITIVE_DEFINITE_SOLVERS = ('cg',)
+POSITIVE_DEFINITE_PRECONDITIONERS = ('ichol',)
+
+
+@dataclass
+class L_Factor:
+    """
+    Sparse LU factorization of L (SuperLU), after reordering the
+    leaves to reduce the fill-in. L is symmetric but not positive
+    definite: there is no Cholesky factorization.
+    Parameters:
+        permutation (np.ndarray): leaf order of the factorized matrix
+        lu (scipy.sparse.linalg.SuperLU): factors
+    """
+    permutation: np.ndarray
+    lu: object
+
+    def solve(self, v_vec):
+        """
+        x such that L x = v (two triangular solves)
+        """
+        x_vec = np.empty(len(v_vec))
+        x_vec[self.permutation] = self.lu.solve(
+            np.asarray(v_vec, dtype=np.float64)[self.permutation])
+        return x_vec
+
+
+def factorize_L(leaf_nodes: List[Node], neighbours=None,
+                ordering: str = 'colamd'):
+    """
+    Assembles and factorizes L.
+    ordering:
+        'colamd': column ordering of SuperLU (least fill-in)
+        'rcm': reverse Cuthill-McKee ordering of the leaves
+        'morton': the leaves as they are (Morton order for both
+                  octrees)
+    Returns an `L_Factor`.
+    """
+    if ordering not in ORDERINGS:
+        raise ValueError('Unknown ordering: ' + repr(ordering))
+    L_mat = L_sparse(leaf_nodes, neighbours)
+    permutation = np.arange(L_mat.shape[0])
+    if ordering == 'rcm':
+        permutation = csgraph.reverse_cuthill_mckee(L_mat,
+                                                    symmetric_mode=True)
+        L_mat = L_mat[permutation][:, permutation]
+    lu = sparse.linalg.splu(
+        L_mat.tocsc(),
+        permc_spec='COLAMD' if ordering == 'colamd' else 'NATURAL')
+    return L_Factor(permutation, lu)
+
+
+def solve_for_x(leaf_nodes: List[Node], neighbours=None,
+                use_sparse: bool = True, solver: str = 'direct',
+                tol: float = 1e-6, maxiter: int = None, x0=None,
+                preconditioner='jacobi', residuals: list = None,
+                matrix_free: bool = False, factor: L_Factor = None,
+                normal_sums=None, threads: int = None):
     """
     Solves the system of equations to obtain
-    the vector x
+    the vector x.
+    use_sparse: assemble L as a sparse matrix (otherwise dense)
+    solver:
+        'direct': (sparse or dense) LU factorization
+        'minres': MINRES (`johnvm.solvers.minres`, for symmetric L)
+    L is indefinite, so conjugate gradient ('cg') and the incomplete
+    Cholesky preconditioner ('ichol') of `johnvm.solvers`, which need
+    a positive definite matrix, are rejected with a ValueError.
+    The iterative solvers need L to be symmetric, which is the case
+    for leaves of a single depth only (a ValueError is raised
+    otherwise, e.g. for adaptive octrees): L is then stored as its
+    upper triangle only.
+    The iterative solvers stop at a relative residual `tol` or after
+    `maxiter` iterations, start from `x0` (default zero), and use the
+    `preconditioner` ('jacobi', None or a function).
+    If `residuals` is a list, the history of the relative residual
+    norms is appended to it.
+    matrix_free: the iterative solvers use `Poisson_Operator`
+    (L is never stored; 'jacobi' or no preconditioner only)
+    factor: factorization of L (`factorize_L`, `Octree.L_factor`):
+    only v is computed, and solved for with the factors
+    normal_sums: summed normals of the leaves, see `v`
+    threads: number of threads of the assembly kernels (default: all)
     """
-    L_mat = L(leaf_nodes)
-    v_vec = v(leaf_nodes)
-    x_vec = np.linalg.solve(L_mat, v_vec)
+    if solver in POSITIVE_DEFINITE_SOLVERS:
+        raise ValueError(repr(solver) + ' needs a positive definite L, '
+                         "but L is indefinite: use solver='minres'")
+    if (solver in SOLVERS
+            and preconditioner in POSITIVE_DEFINITE_PRECONDITIONERS):
+        raise ValueError(repr(preconditioner) + ' needs a positive '
+                         'definite L, but L is indefinite: use '
+                         "preconditioner='jacobi'")
+    if neighbours is None:
+        neighbours = leaf_neighbours(*leaf_arrays(leaf_nodes))
+    v_vec = v(leaf_nodes, neighbours, normal_sums, threads)
+    if factor is not None:
+        return factor.solve(v_vec)
+    symmetric = is_symmetric(leaf_nodes)
+    if solver in SOLVERS and not symmetric:
+        raise ValueError(repr(solver) + ' needs a symmetric L, but the '
+                         'leaves have different depths: use '
+                         "solver='direct'")
+    if matrix_free:
+        if solver not in SOLVERS:
+            raise ValueError('The matrix-free operator needs an '
+                             'iterative solver')
+        L_mat = Poisson_Operator(leaf_nodes, neighbours)
+    elif use_sparse and solver in SOLVERS:
+        # only the upper triangle is assembled and stored
+        L_mat = Symmetric_Matrix(L_sparse(leaf_nodes, neighbours,
+                                          symmetric=True,
+                                          threads=threads))
+    elif use_sparse:
+        L_mat = L_sparse(leaf_nodes, neighbours, threads=threads)
+    else:
+        L_mat = L(leaf_nodes, neighbours, threads)
+    if solver == 'direct':
+        if use_sparse:
+            x_vec = sparse.linalg.spsolve(L_mat.tocsc(), v_vec)
+        else:
+            x_vec = np.linalg.solve(L_mat, v_vec)
+    elif solver in SOLVERS:
+        x_vec = SOLVERS[solver](L_mat, v_vec, x0=x0, tol=tol,
+                                maxiter=maxiter,
+                                preconditioner=preconditioner,
+                                residuals=residuals)
+    else:
+        raise ValueError('Unknown solver: ' + repr(solver))
     return x_vec
 
 
@@ -484,5 +2023,228 @@ def indicator(x, y, z, x_vec, leaf_nodes: List[Node]):
     return value
 
 
+"""
+Batched evaluation of the indicator function
+
+The leaves are looked up by integer cell, one lattice per width (as
+in `leaf_neighbours`): a query point only visits the few cells of
+each width whose support can cover it.
+"""
+
+
+def leaf_lookup(centers, widths):
+    """
+    Lookup structure of the leaves by integer cell.
+    Returns the origin of the lattices, the widths of the lattices,
+    the (L, 3) arrays of the lowest cell and of the extent of each
+    lattice, and the sorted keys of the cells of lattice l in
+    keys[key_offsets[l]:key_offsets[l+1]], with the index of the leaf
+    of every key in `leaf_ids`.
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    widths = np.asarray(widths, dtype=np.float64)
+    if len(widths) == 0:
+        raise ValueError('No leaves')
+    level_widths = np.unique(widths)[::-1]
+    first = np.argmax(widths)
+    origin = centers[first] - widths[first] / 2.00
+    level_lo = np.zeros((len(level_widths), 3), dtype=np.int64)
+    level_dims = np.zeros((len(level_widths), 3), dtype=np.int64)
+    keys, leaf_ids = [], []
+    for l, w in enumerate(level_widths):
+        level = np.flatnonzero(widths == w)
+        cells = np.rint((centers[level] - origin) / w - 0.50).astype(
+            np.int64)
+        level_lo[l] = cells.min(axis=0)
+        level_dims[l] = cells.max(axis=0) - level_lo[l] + 1
+        level_keys = np.ravel_multi_index(tuple((cells - level_lo[l]).T),
+                                          level_dims[l])
+        order = np.argsort(level_keys)
+        keys.append(level_keys[order])
+        leaf_ids.append(level[order])
+    key_offsets = np.cumsum([0] + [len(k) for k in keys])
+    return (origin, level_widths, level_lo, level_dims, key_offsets,
+            np.concatenate(keys), np.concatenate(leaf_ids))
+
+
+@jit(nopython=True, parallel=True)
+def indicator_values(points, x_vec, centers, widths, origin, level_widths,
+                     level_lo, level_dims, key_offsets, keys, leaf_ids):
+    """
+    Low-level function. Used in `indicator_batch`.
+    The support of a leaf of cell j covers u = (q - origin) / w
+    if u - 2 < j < u + 1 along every axis: only these cells are
+    looked up (with a margin for rounding errors, `fo` decides).
+    """
+    norm = np.power(2.0*np.pi, -3.0/2.0)
+    margin = 1e-9
+    result = np.zeros(len(points))
+    for m in prange(len(points)):
+        value = 0.0
+        for l in range(len(level_widths)):
+            w = level_widths[l]
+            half = 3.0*w/2.0
+            first = np.empty(3, dtype=np.int64)
+            last = np.empty(3, dtype=np.int64)
+            for a in range(3):
+                u = (points[m, a] - origin[a]) / w
+                first[a] = max(int(np.ceil(u - 2.0 - margin))
+                               - level_lo[l, a], 0)
+                last[a] = min(int(np.floor(u + 1.0 + margin))
+                              - level_lo[l, a], level_dims[l, a] - 1)
+            for ia in range(first[0], last[0] + 1):
+                for ib in range(first[1], last[1] + 1):
+                    for ic in range(first[2], last[2] + 1):
+                        key = (ia * level_dims[l, 1] + ib) \
+                            * level_dims[l, 2] + ic
+                        pos = find_in_row(key_offsets, keys, l, key)
+                        if pos < 0:
+                            continue
+                        j = leaf_ids[pos]
+                        dx = points[m, 0] - centers[j, 0]
+                        dy = points[m, 1] - centers[j, 1]
+                        dz = points[m, 2] - centers[j, 2]
+                        if abs(dx) < half and abs(dy) < half \
+                                and abs(dz) < half:
+                            value += x_vec[j] * norm * (1.00/w**3) * (
+                                1.00 - 1.0/2.0 * 1.0/w**2
+                                * (dx*dx + dy*dy + dz*dz))
+        result[m] = value
+    return result
+
+
+def indicator_batch(points, x_vec, leaf_nodes: List[Node],
+                    threads: int = None):
+    """
+    Evaluates the indicator function at many points
+    (same values as `indicator`).
+    points: (M, 3) array
+    threads: number of threads of the kernel (default: all)
+    Returns an (M,) array.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    x_vec = np.asarray(x_vec, dtype=np.float64)
+    centers, widths = leaf_arrays(leaf_nodes)
+    if len(x_vec) != len(widths):
+        raise ValueError('x_vec must have one coefficient per leaf')
+    with kernel_threads(threads):
+        return indicator_values(points, x_vec, centers, widths,
+                                *leaf_lookup(centers, widths))
+
+
+"""
+Indicator function on a regular grid
+
+Instead of evaluating every grid node, every leaf adds its basis
+function (times its coefficient) to the nodes inside its support.
+The kernel is parallel over the x planes of the grid: each thread
+writes its own planes, adding the leaves in a fixed order.
+"""
+
+
+def grid_axes(bounds, res):
+    """
+    Coordinates of the grid nodes along each axis.
+    bounds: ((xmin, ymin, zmin), (xmax, ymax, zmax))
+    res: number of nodes along each axis (int, or one per axis)
+    Node i of an axis is at min + i (max - min) / (res - 1).
+    Returns the (3,) arrays of the minimum, of the spacing and of the
+    number of nodes.
+    """
+    lo, hi = (np.asarray(b, dtype=np.float64).reshape(3) for b in bounds)
+    res = np.broadcast_to(np.asarray(res, dtype=np.int64), (3,)).copy()
+    if np.any(res < 2) or np.any(hi <= lo):
+        raise ValueError('The grid needs at least 2 nodes per axis '
+                         'and non-empty bounds')
+    return lo, (hi - lo) / (res - 1), res
+
+
+@jit(nopython=True, parallel=True)
+def splat_indicator(volume, lo, spacing, centers, widths, x_vec,
+                    plane_ptr, plane_leaves):
+    """
+    Low-level function. Used in `indicator_grid`.
+    Adds the basis function of every leaf to the nodes of its
+    support. The leaves overlapping the plane x = lo[0] + i spacing[0]
+    are plane_leaves[plane_ptr[i]:plane_ptr[i+1]].
+    """
+    norm = np.power(2.0*np.pi, -3.0/2.0)
+    margin = 1e-9
+    ny, nz = volume.shape[1], volume.shape[2]
+    for i in prange(volume.shape[0]):
+        gx = lo[0] + i * spacing[0]
+        for k in range(plane_ptr[i], plane_ptr[i+1]):
+            j = plane_leaves[k]
+            w = widths[j]
+            half = 3.0*w/2.0
+            dx = gx - centers[j, 0]
+            if not abs(dx) < half:
+                continue
+            scale = x_vec[j] * norm * (1.00/w**3)
+            y0 = max(int(np.ceil((centers[j, 1] - half - lo[1])
+                                 / spacing[1] - margin)), 0)
+            y1 = min(int(np.floor((centers[j, 1] + half - lo[1])
+                                  / spacing[1] + margin)), ny - 1)
+            z0 = max(int(np.ceil((centers[j, 2] - half - lo[2])
+                                 / spacing[2] - margin)), 0)
+            z1 = min(int(np.floor((centers[j, 2] + half - lo[2])
+                                  / spacing[2] + margin)), nz - 1)
+            for iy in range(y0, y1 + 1):
+                dy = lo[1] + iy * spacing[1] - centers[j, 1]
+                if not abs(dy) < half:
+                    continue
+                for iz in range(z0, z1 + 1):
+                    dz = lo[2] + iz * spacing[2] - centers[j, 2]
+                    if not abs(dz) < half:
+                        continue
+                    volume[i, iy, iz] += scale * (
+                        1.00 - 1.0/2.0 * 1.0/w**2
+                        * (dx*dx + dy*dy + dz*dz))
+
+
+def indicator_grid(bounds, res, x_vec, leaf_nodes: List[Node],
+                   dtype=np.float64, out=None, threads: int = None):
+    """
+    Evaluates the indicator function on a regular grid
+    (same values as `indicator` at the nodes).
+    bounds, res: see `grid_axes`
+    dtype: np.float32 or np.float64
+    out: preallocated (nx, ny, nz) volume to write into
+    threads: number of threads of the kernel (default: all)
+    Returns the volume, indexed [ix, iy, iz].
+    The cost is proportional to the number of (leaf, node in its
+    support) pairs, not to the number of nodes times leaves.
+    """
+    lo, spacing, res = grid_axes(bounds, res)
+    x_vec = np.asarray(x_vec, dtype=np.float64)
+    centers, widths = leaf_arrays(leaf_nodes)
+    if len(x_vec) != len(widths):
+        raise ValueError('x_vec must have one coefficient per leaf')
+    if out is None:
+        out = np.zeros(tuple(res), dtype=dtype)
+    else:
+        if out.shape != tuple(res):
+            raise ValueError('out must have shape ' + str(tuple(res)))
+        out[...] = 0.00
+    # x planes overlapped by every leaf
+    half = 3.0 * widths / 2.0
+    first = np.clip(np.ceil((centers[:, 0] - half - lo[0]) / spacing[0]
+                            - 1e-9), 0, res[0]).astype(np.int64)
+    last = np.clip(np.floor((centers[:, 0] + half - lo[0]) / spacing[0]
+                            + 1e-9), -1, res[0] - 1).astype(np.int64)
+    counts = np.maximum(last - first + 1, 0)
+    leaves = np.repeat(np.arange(len(widths)), counts)
+    planes = np.repeat(first, counts) + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                            counts))
+    order = np.argsort(planes, kind='stable')
+    plane_ptr = np.zeros(res[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(planes, minlength=res[0]), out=plane_ptr[1:])
+    with kernel_threads(threads):
+        splat_indicator(out, lo, spacing, centers, widths, x_vec,
+                        plane_ptr, leaves[order])
+    return out
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,306 @@
+import inspect
+import warnings
+import numpy as np
+from numba import jit
+from scipy import sparse
+import scipy.sparse.linalg
+
+
+"""
+Iterative solvers for the (sparse or matrix-free) system L x = v.
+
+The matrix `A` can be a dense array, a scipy sparse matrix, a
+`Symmetric_Matrix` or a `scipy.sparse.linalg.LinearOperator`:
+the solvers only need `A @ x` (and the matrix entries for the
+preconditioners).
+"""
+
+
+# the tolerance of `scipy.sparse.linalg.minres` is `rtol` since
+# scipy 1.12 (and `tol` before)
+_MINRES_TOL = ('rtol' if 'rtol' in inspect.signature(
+    scipy.sparse.linalg.minres).parameters else 'tol')
+
+
+class Symmetric_Matrix(scipy.sparse.linalg.LinearOperator):
+    """
+    Symmetric sparse matrix stored as its upper triangle
+    (diagonal included), used through products only.
+    """
+
+    def __init__(self, upper):
+        self.upper = sparse.csr_matrix(upper)
+        # transposed view (CSC), no copy
+        self.lower = self.upper.T
+        self.diag = self.upper.diagonal()
+        super().__init__(dtype=np.float64, shape=self.upper.shape)
+
+    def _matvec(self, x):
+        x = np.ravel(x)
+        return self.upper @ x + self.lower @ x - self.diag * x
+
+    def _rmatvec(self, x):
+        return self._matvec(x)
+
+    def diagonal(self):
+        return self.diag
+
+    def tocsr(self):
+        """
+        The full matrix
+        """
+        return (self.upper + self.lower
+                - sparse.diags(self.diag)).tocsr()
+
+
+@jit(nopython=True)
+def ichol0(indptr, indices, data, n):
+    """
+    Low-level function. Used in `ichol_preconditioner`.
+    Incomplete Cholesky factorization with zero fill-in, IC(0),
+    of a symmetric matrix given by its lower triangle in CSR format
+    (sorted indices, diagonal entry last in every row).
+    Returns the values of the factor (same pattern), and the index
+    of the first row with a non-positive pivot (-1 if none).
+    """
+    values = data.copy()
+    for i in range(n):
+        start, stop = indptr[i], indptr[i+1]
+        for k in range(start, stop):
+            j = indices[k]
+            # dot product of rows i and j of the factor, columns < j
+            s = 0.0
+            a = start
+            b = indptr[j]
+            while a < k and b < indptr[j+1] - 1:
+                if indices[a] == indices[b]:
+                    s += values[a] * values[b]
+                    a += 1
+                    b += 1
+                elif indices[a] < indices[b]:
+                    a += 1
+                else:
+                    b += 1
+            if j < i:
+                values[k] = (values[k] - s) / values[indptr[j+1] - 1]
+            else:
+                pivot = values[k] - s
+                if pivot <= 0.0:
+                    return values, i
+                values[k] = np.sqrt(pivot)
+    return values, -1
+
+
+@jit(nopython=True)
+def lower_solve(indptr, indices, values, y):
+    """
+    Solves F x = y, F lower triangular in CSR format
+    (diagonal entry last in every row)
+    """
+    x = y.copy()
+    for i in range(len(x)):
+        s = x[i]
+        for k in range(indptr[i], indptr[i+1] - 1):
+            s -= values[k] * x[indices[k]]
+        x[i] = s / values[indptr[i+1] - 1]
+    return x
+
+
+@jit(nopython=True)
+def upper_solve(indptr, indices, values, y):
+    """
+    Solves F^T x = y, F lower triangular in CSR format
+    (diagonal entry last in every row)
+    """
+    x = y.copy()
+    for i in range(len(x) - 1, -1, -1):
+        x[i] /= values[indptr[i+1] - 1]
+        for k in range(indptr[i], indptr[i+1] - 1):
+            x[indices[k]] -= values[k] * x[i]
+    return x
+
+
+def jacobi_preconditioner(A):
+    """
+    M^-1 r = r / diag(A)
+    """
+    diagonal = np.asarray(A.diagonal(), dtype=np.float64)
+    if np.any(diagonal == 0.00):
+        raise ValueError('Jacobi preconditioner: zero on the diagonal')
+    inverse = 1.00 / diagonal
+    return lambda r: inverse * r
+
+
+def ichol_preconditioner(A, shifts=(0.00, 1e-3, 1e-2, 1e-1, 1.00)):
+    """
+    M^-1 r = (F F^T)^-1 r, F the IC(0) factor of A.
+    If the factorization breaks down (A is not positive definite
+    enough), it is retried on A + shift * diag(A) for growing shifts.
+    """
+    if isinstance(A, Symmetric_Matrix):
+        lower = A.lower.tocsr()
+    else:
+        lower = sparse.tril(sparse.csr_matrix(A), format='csr')
+    lower.sum_duplicates()
+    lower.sort_indices()
+    n = lower.shape[0]
+    diagonal = lower.diagonal()
+    if np.any(diagonal <= 0.00):
+        raise ValueError('Incomplete Cholesky: the diagonal of the '
+                         'matrix must be positive')
+    if np.any(np.diff(lower.indptr) == 0) or np.any(
+            lower.indices[lower.indptr[1:] - 1] != np.arange(n)):
+        raise ValueError('Incomplete Cholesky: missing diagonal entries')
+    last = lower.indptr[1:] - 1
+    for shift in shifts:
+        data = lower.data.copy()
+        data[last] *= 1.00 + shift
+        values, failed = ichol0(lower.indptr, lower.indices, data, n)
+        if failed < 0:
+            break
+    else:
+        raise np.linalg.LinAlgError('Incomplete Cholesky breakdown '
+                                    '(matrix not positive definite)')
+    indptr, indices = lower.indptr, lower.indices
+    return lambda r: upper_solve(indptr, indices, values,
+                                 lower_solve(indptr, indices, values, r))
+
+
+PRECONDITIONERS = {
+    'jacobi': jacobi_preconditioner,
+    'ichol': ichol_preconditioner,
+}
+
+
+def make_preconditioner(A, preconditioner):
+    """
+    preconditioner: None, 'jacobi', 'ichol', or a function r -> M^-1 r
+    """
+    if preconditioner is None:
+        return lambda r: r
+    if callable(preconditioner):
+        return preconditioner
+    if preconditioner not in PRECONDITIONERS:
+        raise ValueError('Unknown preconditioner: ' + repr(preconditioner))
+    return PRECONDITIONERS[preconditioner](A)
+
+
+def pcg(A, b, x0=None, tol=1e-6, maxiter=None, preconditioner='jacobi',
+        residuals=None):
+    """
+    Preconditioned conjugate gradient for A x = b,
+    A symmetric positive definite.
+    Stops when ||b - A x|| <= tol ||b||, or after `maxiter` iterations
+    (default: 10 times the size of the system).
+    x0: initial guess (default: zero)
+    residuals: if a list is given, the relative residual norm
+    ||b - A x|| / ||b|| of every iteration is appended to it
+    Returns x. Warns if it did not converge, and raises a LinAlgError
+    if A turns out not to be positive definite.
+    """
+    b = np.asarray(b, dtype=np.float64)
+    n = len(b)
+    if maxiter is None:
+        maxiter = 10 * n
+    apply_M = make_preconditioner(A, preconditioner)
+    if x0 is None:
+        x = np.zeros(n)
+        r = b.copy()
+    else:
+        x = np.array(x0, dtype=np.float64)
+        r = b - A @ x
+    b_norm = np.linalg.norm(b)
+    if b_norm == 0.00:
+        b_norm = 1.00
+    history = [np.linalg.norm(r) / b_norm]
+    z = apply_M(r)
+    p = z.copy()
+    rz = r @ z
+    for _ in range(maxiter):
+        if history[-1] <= tol:
+            break
+        Ap = A @ p
+        pAp = p @ Ap
+        if pAp <= 0.00:
+            raise np.linalg.LinAlgError(
+                'pcg: the matrix is not positive definite (relative '
+                'residual ' + str(history[-1]) + ' after '
+                + str(len(history) - 1) + ' iterations)')
+        alpha = rz / pAp
+        x += alpha * p
+        r -= alpha * Ap
+        history.append(np.linalg.norm(r) / b_norm)
+        z = apply_M(r)
+        rz_new = r @ z
+        p *= rz_new / rz
+        p += z
+        rz = rz_new
+    else:
+        if history[-1] > tol:
+            warnings.warn('pcg: no convergence after ' + str(maxiter)
+                          + ' iterations (relative residual '
+                          + str(history[-1]) + ')')
+    if residuals is not None:
+        residuals.extend(history)
+    return x
+
+
+class _Converged(Exception):
+    """
+    Raised by the callback of `minres` to stop scipy's iteration
+    """
+
+
+def minres(A, b, x0=None, tol=1e-6, maxiter=None, preconditioner='jacobi',
+           residuals=None):
+    """
+    MINRES for A x = b, A symmetric but possibly indefinite
+    (the preconditioner must still be positive definite).
+    Same parameters and stopping test as `pcg`.
+    The stopping test of `scipy.sparse.linalg.minres` (an estimate
+    of the preconditioned residual relative to ||A|| ||x|| + ||b||)
+    can be met orders of magnitude above the true residual: it is
+    disabled, and the true residual is checked after every
+    iteration instead, at the cost of one extra product with A.
+    """
+    b = np.asarray(b, dtype=np.float64)
+    n = len(b)
+    if maxiter is None:
+        maxiter = 10 * n
+    apply_M = make_preconditioner(A, preconditioner)
+    M = scipy.sparse.linalg.LinearOperator((n, n), matvec=apply_M,
+                                           dtype=np.float64)
+    x = np.zeros(n) if x0 is None else np.array(x0, dtype=np.float64)
+    b_norm = np.linalg.norm(b)
+    if b_norm == 0.00:
+        b_norm = 1.00
+    history = [np.linalg.norm(b - A @ x) / b_norm]
+
+    def check(xk):
+        history.append(np.linalg.norm(b - A @ xk) / b_norm)
+        if history[-1] <= tol:
+            check.x = xk.copy()
+            raise _Converged
+
+    if history[-1] > tol:
+        try:
+            x, _ = scipy.sparse.linalg.minres(
+                A, b, x0=x, maxiter=maxiter, M=M, callback=check,
+                **{_MINRES_TOL: 0.00})
+        except _Converged:
+            x = check.x
+    # (scipy calls back with its last iterate: history[-1] is its
+    # residual, also if it stopped on a breakdown)
+    if history[-1] > tol:
+        warnings.warn('minres: no convergence after '
+                      + str(len(history) - 1) + ' iterations '
+                      '(relative residual ' + str(history[-1]) + ')')
+    if residuals is not None:
+        residuals.extend(history)
+    return x
+
+
+SOLVERS = {
+    'cg': pcg,
+    'minres': minres,
+}
@@ -1,5 +1,5 @@
 import matplotlib.pyplot as plt
-from johnvm.poisson import Octree, Oriented_Point, Oriented_Points, Point,  solve_for_x, indicator, fo
+from johnvm.poisson import Octree, Oriented_Points, Point,  solve_for_x, indicator, indicator_batch, fo
 from johnvm.util_vis import show_Oriented_Points, show_octree, show_octree_leaf
 import numpy as np
 
@@ -33,16 +33,11 @@ def test_generate_sphere(n_pts=1000):
     Generate oriented points sampled from a sphere
     centered at (0,0,0) with radius 1
     """
-    pts = Oriented_Points()  # initialize collector of points
     # use numpy to sample points on a sphere
     point_matrix = np.random.normal(size=(n_pts, 3))
-    for i in range(n_pts):
-        pt_data = point_matrix[i, :] / \
-            np.linalg.norm(point_matrix[i, :])  # normalize
-        # add in the point list
-        pts.add(Oriented_Point(pt_data[0], pt_data[1], pt_data[2],
-                               pt_data[0], pt_data[1], pt_data[2]))
-    return pts
+    point_matrix /= np.linalg.norm(point_matrix, axis=1)[:, np.newaxis]
+    # the normals of a unit sphere are the points themselves
+    return Oriented_Points.from_arrays(point_matrix, point_matrix.copy())
 
 
 pts = test_generate_sphere(2000)
@@ -51,20 +46,16 @@ octree = Octree(pts, 4)
 x_vector = solve_for_x(octree.leaf_nodes)
 
 
-def my_fun(x, y):
-    return indicator(x, y, 0.00, x_vector, octree.leaf_nodes)
-
-
 xlist = np.linspace(-1.0, 0.0, 100)
 ylist = np.linspace(0.0, 1.0, 100)
 X, Y = np.meshgrid(xlist, ylist)
 
-from tqdm import tqdm
-Z = np.full((len(xlist), len(ylist)), 0.00)
-for i, x in enumerate(tqdm(xlist)):
-    for j, y in enumerate(ylist):
-        Z[i,j] = my_fun(x,y)
-
+# Z[i, j] is the indicator at (xlist[i], ylist[j], 0.00)
+grid = np.column_stack((np.repeat(xlist, len(ylist)),
+                        np.tile(ylist, len(xlist)),
+                        np.full(len(xlist) * len(ylist), 0.00)))
+Z = indicator_batch(grid, x_vector, octree.leaf_nodes).reshape(
+    len(xlist), len(ylist))
 
 from matplotlib import cm
 fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
@@ -1,28 +1,15 @@
 import matplotlib.pyplot as plt
-from johnvm.poisson import Octree, Oriented_Point, Oriented_Points, Point,  solve_for_x, indicator, fo
+from johnvm.poisson import Octree, Oriented_Points, Point,  solve_for_x, indicator, indicator_batch, fo
 from johnvm.util_vis import show_Oriented_Points, show_octree, show_octree_leaf
 import numpy as np
 
 
-# Define the points
-pts = Oriented_Points()  # initialize collector of points
-
-pts.add(Oriented_Point(+0.50, +0.50, +0.50,
-                       +1.0/np.sqrt(3), +1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(-0.50, +0.50, +0.50,
-                       -1.0/np.sqrt(3), +1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(-0.50, -0.50, +0.50,
-                       -1.0/np.sqrt(3), -1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(+0.50, -0.50, +0.50,
-                       +1.0/np.sqrt(3), -1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(+0.50, +0.50, -0.50,
-                       +1.0/np.sqrt(3), +1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(-0.50, +0.50, -0.50,
-                       -1.0/np.sqrt(3), +1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(-0.50, -0.50, -0.50,
-                       -1.0/np.sqrt(3), -1.0/np.sqrt(3), 0.00))
-pts.add(Oriented_Point(+0.50,-0.50,-0.50,
-                       +1.0/np.sqrt(3), -1.0/np.sqrt(3), 0.00))
+# Define the points: the corners of a cube
+signs = np.array([[+1, +1, +1], [-1, +1, +1], [-1, -1, +1], [+1, -1, +1],
+                  [+1, +1, -1], [-1, +1, -1], [-1, -1, -1], [+1, -1, -1]])
+normals = signs / np.sqrt(3)
+normals[:, 2] = 0.00
+pts = Oriented_Points.from_arrays(0.50 * signs, normals)
 
 octree = Octree(pts, 1)
 
@@ -31,19 +18,16 @@ show_octree(octree)
 x_vector = solve_for_x(octree.leaf_nodes)
 
 
-def my_fun(x, y):
-    return indicator(x, y, 0.50, x_vector, octree.leaf_nodes)
-
-
 xlist = np.linspace(-1.0, 1.0, 100)
 ylist = np.linspace(-1.0, 1.0, 100)
 X, Y = np.meshgrid(xlist, ylist)
 
-from tqdm import tqdm
-Z = np.full((len(xlist), len(ylist)), 0.00)
-for i, x in enumerate(tqdm(xlist)):
-    for j, y in enumerate(ylist):
-        Z[i,j] = my_fun(x,y)
+# Z[i, j] is the indicator at (xlist[i], ylist[j], 0.50)
+grid = np.column_stack((np.repeat(xlist, len(ylist)),
+                        np.tile(ylist, len(xlist)),
+                        np.full(len(xlist) * len(ylist), 0.50)))
+Z = indicator_batch(grid, x_vector, octree.leaf_nodes).reshape(
+    len(xlist), len(ylist))
 
 from matplotlib import cm
 fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
@@ -0,0 +1,330 @@
+import io
+import os
+import struct
+import warnings
+from itertools import islice
+import numpy as np
+
+
+"""
+Binary point cloud files (.pcb)
+
+Layout: a fixed-size header followed by the points, one record per
+point, each record holding the six little-endian floats
+x, y, z, nx, ny, nz. The records can be memory-mapped directly,
+so opening a file does not parse (or even read) the points.
+"""
+
+PCB_MAGIC = b'PC2MPCB\x00'
+PCB_VERSION = 1
+# magic, version, bytes per value, values per point, number of points
+PCB_HEADER = struct.Struct('<8sIIIQ')
+PCB_HEADER_SIZE = 64  # header is padded, so that records stay aligned
+PCB_COLUMNS = 6
+
+
+def _pcb_dtype(itemsize):
+    if itemsize == 4:
+        return np.dtype('<f4')
+    if itemsize == 8:
+        return np.dtype('<f8')
+    raise ValueError('Unsupported value size: ' + repr(itemsize))
+
+
+def read_pcb_header(path):
+    """
+    Reads the header of a .pcb file.
+    Returns the dtype of the values and the number of points.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read(PCB_HEADER.size)
+    if len(raw) < PCB_HEADER.size:
+        raise ValueError('Not a .pcb file (too short): ' + repr(path))
+    magic, version, itemsize, columns, count = PCB_HEADER.unpack(raw)
+    if magic != PCB_MAGIC:
+        raise ValueError('Not a .pcb file (bad magic): ' + repr(path))
+    if version != PCB_VERSION or columns != PCB_COLUMNS:
+        raise ValueError('Unsupported .pcb file (version '
+                         + str(version) + ', ' + str(columns)
+                         + ' columns): ' + repr(path))
+    return _pcb_dtype(itemsize), count
+
+
+def _write_pcb_header(f, dtype, count):
+    f.seek(0)
+    f.write(PCB_HEADER.pack(PCB_MAGIC, PCB_VERSION, dtype.itemsize,
+                            PCB_COLUMNS, count).ljust(PCB_HEADER_SIZE,
+                                                      b'\x00'))
+
+
+def _records(positions, normals, dtype):
+    """
+    Interleave locations and normals into (N, 6) records
+    """
+    positions = np.asarray(positions).reshape(-1, 3)
+    if normals is None:
+        normals = np.zeros_like(positions)
+    normals = np.asarray(normals).reshape(-1, 3)
+    records = np.empty((len(positions), PCB_COLUMNS), dtype=dtype)
+    records[:, 0:3] = positions
+    records[:, 3:6] = normals
+    return records
+
+
+def write_pcb(path, positions, normals=None, dtype=np.float64):
+    """
+    Writes (N, 3) locations and normals to a new .pcb file.
+    dtype: np.float64, or np.float32 for half the size (lossy: about
+    1e-7 relative error on the coordinates)
+    """
+    dtype = _pcb_dtype(np.dtype(dtype).itemsize)
+    records = _records(positions, normals, dtype)
+    with open(path, 'wb') as f:
+        _write_pcb_header(f, dtype, len(records))
+        f.seek(PCB_HEADER_SIZE)
+        records.tofile(f)
+
+
+def append_pcb(path, positions, normals=None, dtype=np.float64):
+    """
+    Appends a chunk of points at the end of a .pcb file.
+    The file is created (with the given dtype) if it does not exist,
+    otherwise the values are converted to the dtype of the file.
+    """
+    if not os.path.exists(path):
+        write_pcb(path, positions, normals, dtype)
+        return
+    dtype, count = read_pcb_header(path)
+    records = _records(positions, normals, dtype)
+    with open(path, 'r+b') as f:
+        f.seek(PCB_HEADER_SIZE + count * PCB_COLUMNS * dtype.itemsize)
+        records.tofile(f)
+        f.truncate()
+        # the header is updated last: an interrupted append
+        # leaves the file as it was before
+        f.flush()
+        _write_pcb_header(f, dtype, count + len(records))
+
+
+def open_pcb(path, mode='r'):
+    """
+    Memory-maps the records of a .pcb file (no copy, nothing is read
+    until it is accessed).
+    Returns an (N, 6) array; columns are x, y, z, nx, ny, nz.
+    mode: 'r' for read-only, 'r+' to modify the points in place,
+    'c' for copy-on-write
+    """
+    dtype, count = read_pcb_header(path)
+    if count == 0:
+        return np.empty((0, PCB_COLUMNS), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode,
+                     offset=PCB_HEADER_SIZE,
+                     shape=(count, PCB_COLUMNS))
+
+
+def npts_to_pcb(npts_path, pcb_path, dtype=np.float64,
+                chunk_size=1000000):
+    """
+    Converts a space-delimited .npts text file to a .pcb file,
+    `chunk_size` lines at a time.
+    Every line must hold the six values x y z nx ny nz.
+    dtype: see `write_pcb` (np.float32 loses precision)
+    Returns the number of points written.
+    """
+    dtype = _pcb_dtype(np.dtype(dtype).itemsize)
+    count = 0
+    with open(pcb_path, 'wb') as out:
+        _write_pcb_header(out, dtype, 0)
+        out.seek(PCB_HEADER_SIZE)
+        with open(npts_path, 'r') as f:
+            for chunk in _iter_text_chunks(f, chunk_size):
+                if chunk.shape[1] != PCB_COLUMNS:
+                    raise ValueError(
+                        'Expected ' + str(PCB_COLUMNS) + ' columns, found '
+                        + str(chunk.shape[1]) + ': ' + repr(npts_path))
+                chunk.astype(dtype).tofile(out)
+                count += len(chunk)
+        _write_pcb_header(out, dtype, count)
+    return count
+
+
+def pcb_to_npts(pcb_path, npts_path, chunk_size=1000000):
+    """
+    Converts a .pcb file to a space-delimited .npts text file,
+    `chunk_size` points at a time.
+    Returns the number of points written.
+    """
+    records = open_pcb(pcb_path)
+    with open(npts_path, 'w') as out:
+        for start in range(0, len(records), chunk_size):
+            np.savetxt(out, records[start:start+chunk_size],
+                       delimiter=' ')
+    return len(records)
+
+
+"""
+Streaming readers
+
+`iter_chunks` yields the points of a file as fixed-size chunks
+of (positions, normals) arrays, so that the whole cloud never has to
+be in memory at once.
+"""
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+
+def _split_columns(chunk):
+    """
+    Locations are the first three columns, normals the next three
+    (if there are any).
+    """
+    positions = chunk[:, 0:3]
+    normals = chunk[:, 3:6] if chunk.shape[1] >= 6 else None
+    return positions, normals
+
+
+def _not_normals(normals):
+    """
+    Do the normal columns of an .xyz file look like something else?
+    (e.g. x y z r g b: lengths up to 255*sqrt(3))
+    """
+    if normals is None or len(normals) == 0:
+        return False
+    return bool(np.any(np.einsum('ij,ij->i', normals, normals) > 4.00))
+
+
+def _iter_text_chunks(f, chunk_size, usecols=None):
+    while True:
+        lines = list(islice(f, chunk_size))
+        if not lines:
+            return
+        yield np.loadtxt(lines, ndmin=2, usecols=usecols)
+
+
+def _read_ply_header(f):
+    """
+    Parses the header of a PLY file.
+    Returns the format, the number of vertices and the list of
+    (name, type) of the vertex properties.
+    """
+    if f.readline().strip() != b'ply':
+        raise ValueError('Not a PLY file')
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('Unterminated PLY header')
+        words = line.decode('ascii').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'end_header':
+            break
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], None))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+    if not elements or elements[0][0] != 'vertex':
+        raise ValueError('The first PLY element must be "vertex"')
+    _, count, properties = elements[0]
+    if any(t is None for _, t in properties):
+        raise ValueError('List properties on vertices are not supported')
+    return fmt, count, properties
+
+
+def _iter_ply_chunks(f, chunk_size):
+    fmt, count, properties = _read_ply_header(f)
+    names = [name for name, _ in properties]
+    columns = [names.index(c) for c in ('x', 'y', 'z')]
+    if all(c in names for c in ('nx', 'ny', 'nz')):
+        columns += [names.index(c) for c in ('nx', 'ny', 'nz')]
+    if fmt == 'ascii':
+        text = io.TextIOWrapper(f, encoding='ascii')
+        for chunk in _iter_text_chunks(islice(text, count), chunk_size,
+                                       usecols=columns):
+            yield chunk
+        text.detach()
+        return
+    if fmt == 'binary_little_endian':
+        byteorder = '<'
+    elif fmt == 'binary_big_endian':
+        byteorder = '>'
+    else:
+        raise ValueError('Unknown PLY format: ' + repr(fmt))
+    dtype = np.dtype([(name, byteorder + t) for name, t in properties])
+    for start in range(0, count, chunk_size):
+        records = np.fromfile(f, dtype=dtype,
+                              count=min(chunk_size, count - start))
+        if len(records) == 0:
+            raise ValueError('Truncated PLY file')
+        chunk = np.empty((len(records), len(columns)))
+        for k, c in enumerate(columns):
+            chunk[:, k] = records[names[c]]
+        yield chunk
+
+
+def iter_chunks(path, chunk_size=1000000):
+    """
+    Generator over the points of a point cloud file, `chunk_size`
+    points at a time. Supported formats (from the extension):
+        .npts: space-delimited x y z nx ny nz
+        .xyz: space-delimited x y z [nx ny nz] (with a warning if
+              the last three columns are not normals, e.g. colors)
+        .ply: ascii, binary_little_endian or binary_big_endian
+        .pcb: binary file of `write_pcb` (memory-mapped slices)
+    Yields (positions, normals) pairs of (n, 3) arrays;
+    normals is None if the file does not have them.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pcb':
+        records = open_pcb(path)
+        for start in range(0, len(records), chunk_size):
+            yield _split_columns(records[start:start+chunk_size])
+    elif extension in ('.npts', '.xyz'):
+        warned = extension == '.npts'
+        with open(path, 'r') as f:
+            for chunk in _iter_text_chunks(f, chunk_size):
+                positions, normals = _split_columns(chunk)
+                if not warned and _not_normals(normals):
+                    warnings.warn('Columns 4 to 6 of ' + repr(path)
+                                  + ' do not look like normals (RGB '
+                                  'colors?), but are read as normals')
+                    warned = True
+                yield positions, normals
+    elif extension == '.ply':
+        with open(path, 'rb') as f:
+            for chunk in _iter_ply_chunks(f, chunk_size):
+                yield _split_columns(chunk)
+    else:
+        raise ValueError('Unknown point cloud format: ' + repr(path))
+
+
+def chunk_bbox(chunks):
+    """
+    Bounding box of a stream of (positions, normals) chunks,
+    computed in one pass.
+    Returns the (3,) arrays of minimum and maximum coordinates.
+    """
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    for positions, _ in chunks:
+        if len(positions):
+            lo = np.minimum(lo, positions.min(axis=0))
+            hi = np.maximum(hi, positions.max(axis=0))
+    if np.any(lo > hi):
+        raise ValueError('Empty point cloud')
+    return lo, hi
@@ -8,13 +8,7 @@ def show_Oriented_Points(pts: Oriented_Points):
     """
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
-    x_coords = []
-    y_coords = []
-    z_coords = []
-    for pt in pts.points:
-        x_coords.append(pt.x)
-        y_coords.append(pt.y)
-        z_coords.append(pt.z)
+    x_coords, y_coords, z_coords = pts.positions.T
     ax.scatter(x_coords, y_coords, z_coords)
     plt.show()
 
@@ -111,13 +105,7 @@ def show_octree_leaf(o: Octree, i: int):
     leaf = o.leaf_nodes[i]
     for lines in generate_octree_node_bbox(leaf):
         ax.plot3D(*lines, **kwargs_node)
-    x_coords = []
-    y_coords = []
-    z_coords = []
-    for pt in leaf.contents.points:
-        x_coords.append(pt.x)
-        y_coords.append(pt.y)
-        z_coords.append(pt.z)
+    x_coords, y_coords, z_coords = leaf.contents.positions.T
     ax.scatter(x_coords, y_coords, z_coords)
     plt.show()
 
@@ -139,12 +127,6 @@ def show_octree(o: Octree):
 
         for lines in generate_octree_node_bbox(leaf):
             ax.plot3D(*lines, **kwargs_node)
-        x_coords = []
-        y_coords = []
-        z_coords = []
-        for pt in leaf.contents.points:
-            x_coords.append(pt.x)
-            y_coords.append(pt.y)
-            z_coords.append(pt.z)
+        x_coords, y_coords, z_coords = leaf.contents.positions.T
         ax.scatter(x_coords, y_coords, z_coords, marker=".")
     plt.show()
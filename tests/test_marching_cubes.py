@@ -0,0 +1,129 @@
+import tracemalloc
+
+import numpy as np
+
+import marching_cubes as mc
+
+
+def wavy(x, y, z):
+    return mc.sphere_func(x, y, z) + 0.05 * np.sin(7 * x) * np.cos(5 * y)
+
+
+def triangles(vertices, faces):
+    """
+    The triangles of a mesh as a sorted array of sorted corner
+    coordinates, independent of the vertex and face order
+    """
+    corners = np.round(vertices[faces], 9).reshape(len(faces), 3, 3)
+    corners = [sorted(map(tuple, t)) for t in corners]
+    return np.array(sorted(corners))
+
+
+def edge_uses(faces):
+    edges = np.sort(np.concatenate(
+        [faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    return np.unique(edges, axis=0, return_counts=True)[1]
+
+
+def shell_leaves(n, radius):
+    """
+    Cubes of width 1/n of the unit box around the sphere of
+    `sphere_func`
+    """
+    width = 1.0 / n
+    centers = (np.indices((n, n, n)).reshape(3, -1).T + 0.5) * width
+    distance = np.linalg.norm(centers - 0.5, axis=1)
+    keep = np.abs(distance - radius) < width
+    return centers[keep], np.full(np.count_nonzero(keep), width)
+
+
+class Null_Writer:
+    def write(self, vertices, faces):
+        pass
+
+
+def test_march_volume_closed_mesh_on_the_level_set():
+    res, level = 40, 0.35
+    vertices, faces = mc.march_volume(mc.sample_volume(wavy, res),
+                                      level=level)
+    assert len(faces) > 0
+    # shared vertices: every edge between two faces, Euler
+    # characteristic of a sphere
+    assert set(edge_uses(faces)) == {2}
+    n_edges = 3 * len(faces) // 2
+    assert len(vertices) - n_edges + len(faces) == 2
+    assert len(np.unique(vertices, axis=0)) == len(vertices)
+    # linear interpolation along the edges
+    error = np.abs(wavy(*vertices.T) - level)
+    assert error.max() < 0.01
+
+
+def test_march_volume_bounds():
+    vertices, _ = mc.march_volume(mc.sample_volume(mc.sphere_func, 16),
+                                  -1, 1, -1, 1, -1, 1, level=0.25)
+    vertices_unit, _ = mc.march_volume(mc.sample_volume(mc.sphere_func, 16),
+                                       level=0.25)
+    assert np.allclose(vertices, 2 * vertices_unit - 1)
+
+
+def test_march_slabs_matches_march_volume():
+    for res in (8, 23):
+        vertices, faces = mc.march_volume(mc.sample_volume(wavy, res),
+                                          level=0.35)
+        writer = mc.ArrayWriter()
+        counts = mc.march_slabs(wavy, res, writer, level=0.35)
+        slab_vertices, slab_faces = writer.arrays()
+        assert counts == (len(vertices), len(faces))
+        assert len(slab_vertices) == len(vertices)
+        assert np.array_equal(triangles(vertices, faces),
+                              triangles(slab_vertices, slab_faces))
+        assert set(edge_uses(slab_faces)) == {2}
+
+
+def test_obj_writer(tmp_path):
+    path = tmp_path / 'sphere.obj'
+    with mc.ObjWriter(path) as writer:
+        counts = mc.march_slabs(mc.sphere_func, 12, writer, level=0.3)
+    lines = path.read_text().splitlines()
+    assert sum(l.startswith('v ') for l in lines) == counts[0]
+    faces = np.array([l.split()[1:] for l in lines if l.startswith('f ')],
+                     dtype=np.int64)
+    assert len(faces) == counts[1]
+    assert faces.min() == 1 and faces.max() == counts[0]
+
+
+def test_march_band_matches_march_volume():
+    res, level = 48, 0.3
+    centers, widths = shell_leaves(24, level)
+    evaluated = []
+
+    def f(x, y, z):
+        evaluated.append(np.size(x))
+        return mc.sphere_func(x, y, z)
+
+    vertices, faces = mc.march_volume(mc.sample_volume(mc.sphere_func, res),
+                                      level=level)
+    band_vertices, band_faces = mc.march_band(f, centers, widths, res,
+                                              level=level)
+    assert len(band_vertices) == len(vertices)
+    assert np.array_equal(triangles(vertices, faces),
+                          triangles(band_vertices, band_faces))
+    # every node is evaluated at most once, and only near the leaves
+    assert sum(evaluated) < 0.4 * (res + 1)**3
+
+
+def test_march_band_memory():
+    # without the mesh, the memory of the band is O(res^2): far below
+    # the full volume, and growing 4 times (not 8) when res doubles
+    centers, widths = shell_leaves(16, 0.3)
+    peaks = []
+    for res in (128, 256):
+        tracemalloc.start()
+        try:
+            mc.march_slabs(mc.sphere_func, res, Null_Writer(), level=0.3,
+                           centers=centers, widths=widths)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        assert peaks[-1] < 8 * (res + 1)**3 / 8
+    assert peaks[1] < 5 * peaks[0]
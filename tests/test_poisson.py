@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from johnvm.poisson import (
+    Octree, Linear_Octree, Oriented_Points, I1oop, I2oop,
+    I1oop_separable, I2oop_separable, domain, leaf_arrays,
+    leaf_neighbours, L_sparse, Poisson_Operator, solve_for_x,
+    indicator, indicator_batch, indicator_grid, grid_axes,
+    streaming_voxel_downsample,
+)
+
+
+def sphere_points(n, seed=0):
+    """
+    Oriented points on a unit sphere, with the outward normals
+    """
+    rng = np.random.default_rng(seed)
+    normals = rng.normal(size=(n, 3))
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+    return Oriented_Points.from_arrays(normals.copy(), normals)
+
+
+def random_pairs(n, seed=0):
+    """
+    Random pairs of leaves of widths 2^-1 to 2^-4, most of them
+    overlapping, some of them not (empty domain of integration)
+    """
+    rng = np.random.default_rng(seed)
+    ow = 2.0 ** -rng.integers(1, 5, size=n)
+    owp = 2.0 ** -rng.integers(1, 5, size=n)
+    oc = rng.uniform(0.0, 1.0, size=(n, 3))
+    ocp = oc + rng.uniform(-1.0, 1.0, size=(n, 3)) * 2.0 \
+        * (ow + owp)[:, np.newaxis]
+    lo = np.empty((n, 3))
+    hi = np.empty((n, 3))
+    for k in range(n):
+        for a in range(3):
+            lo[k, a], hi[k, a] = domain(oc[k, a], ow[k], ocp[k, a], owp[k])
+    return oc, ow, ocp, owp, lo, hi
+
+
+def test_separable_integrals_match_direct():
+    oc, ow, ocp, owp, lo, hi = random_pairs(300)
+    sn = np.random.default_rng(1).normal(size=(len(oc), 3))
+    empty = np.any(lo >= hi, axis=1)
+    assert 0 < np.count_nonzero(empty) < len(oc)
+
+    I1 = I1oop_separable(lo, hi, oc, ocp, sn)
+    I2 = I2oop_separable(lo, hi, ocp, owp)
+    assert np.all(I1[empty] == 0.0)
+    assert np.all(I2[empty] == 0.0)
+
+    for k in np.flatnonzero(~empty):
+        box = (lo[k, 0], hi[k, 0], lo[k, 1], hi[k, 1], lo[k, 2], hi[k, 2])
+        I1_direct = I1oop(*box, *oc[k], *ocp[k], *sn[k])
+        I2_direct = I2oop(*box, *ocp[k], owp[k])
+        scale = np.prod(hi[k] - lo[k])
+        assert I1[k] == pytest.approx(I1_direct, rel=1e-6,
+                                      abs=1e-9 * scale)
+        assert I2[k] == pytest.approx(I2_direct, rel=1e-6,
+                                      abs=1e-9 * scale)
+
+
+def brute_force_neighbours(centers, widths):
+    """
+    Pairs with |c - c'| < 3(w + w')/2 along every axis. The centers
+    are on a lattice: supports that only touch (|c - c'| equal to the
+    bound up to rounding) do not overlap.
+    """
+    reach = 1.5 * (widths[:, np.newaxis] + widths[np.newaxis, :]) \
+        * (1.0 - 1e-9)
+    overlap = np.all(
+        np.abs(centers[:, np.newaxis, :] - centers[np.newaxis, :, :])
+        < reach[:, :, np.newaxis], axis=2)
+    return sparse.csr_matrix(overlap)
+
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_leaf_neighbours_match_brute_force(adaptive):
+    points = sphere_points(3000)
+    if adaptive:
+        octree = Octree(points, 5, max_points=20)
+    else:
+        octree = Octree(points, 4)
+    centers, widths = leaf_arrays(octree.leaf_nodes)
+    assert (len(np.unique(widths)) > 1) == adaptive
+    expected = brute_force_neighbours(centers, widths)
+    # a small chunk size exercises the chunked lookup as well
+    for chunk_size in (16384, 7):
+        indptr, indices = leaf_neighbours(centers, widths, chunk_size)
+        np.testing.assert_array_equal(indptr, expected.indptr)
+        np.testing.assert_array_equal(indices, expected.indices)
+
+
+def partition(leaf_nodes):
+    """
+    Depth, center, width and (sorted) contents of every leaf
+    """
+    return [(o.depth, (o.center.x, o.center.y, o.center.z), o.width,
+             sorted(map(tuple, o.contents.positions)))
+            for o in leaf_nodes]
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'max_points': 10},
+    {'min_width': 0.3},
+    {'max_points': 40, 'min_width': 0.1},
+])
+def test_linear_octree_matches_octree(options):
+    points = sphere_points(2000)
+    octree = Octree(points, 5, **options)
+    linear = Linear_Octree(points, 5, **options)
+    expected = partition(octree.leaf_nodes)
+    result = partition(linear.leaf_nodes)
+    assert len(result) == len(expected)
+    for (d, c, w, contents), (d_ref, c_ref, w_ref, contents_ref) \
+            in zip(result, expected):
+        assert d == d_ref
+        np.testing.assert_allclose(c, c_ref, rtol=0, atol=1e-12)
+        assert w == pytest.approx(w_ref)
+        assert contents == contents_ref
+    np.testing.assert_allclose(linear.leaf_normal_sums(),
+                               octree.leaf_normal_sums(), atol=1e-12)
+
+
+def test_symmetric_storage_and_operator():
+    octree = Octree(sphere_points(1500), 4)
+    full = L_sparse(octree.leaf_nodes, octree.neighbours)
+    upper = L_sparse(octree.leaf_nodes, octree.neighbours, symmetric=True)
+    np.testing.assert_allclose(full.toarray(), full.toarray().T,
+                               atol=1e-12 * abs(full).max())
+    np.testing.assert_allclose(sparse.triu(full).toarray(),
+                               upper.toarray())
+    x = np.random.default_rng(0).normal(size=full.shape[0])
+    operator = Poisson_Operator(octree.leaf_nodes, octree.neighbours)
+    np.testing.assert_allclose(operator @ x, full @ x,
+                               rtol=1e-10, atol=1e-10 * abs(full @ x).max())
+    np.testing.assert_allclose(operator.diagonal(), full.diagonal())
+
+
+def test_adaptive_L_is_rejected_by_symmetric_storage():
+    octree = Octree(sphere_points(1500), 5, max_points=20)
+    with pytest.raises(ValueError):
+        L_sparse(octree.leaf_nodes, symmetric=True)
+    with pytest.raises(ValueError):
+        solve_for_x(octree.leaf_nodes, solver='minres')
+
+
+def test_solvers_agree():
+    octree = Octree(sphere_points(1500), 4)
+    direct = solve_for_x(octree.leaf_nodes, octree.neighbours)
+    factored = solve_for_x(octree.leaf_nodes, octree.neighbours,
+                           factor=octree.L_factor('rcm'))
+    np.testing.assert_allclose(factored, direct,
+                               atol=1e-8 * abs(direct).max())
+    residuals = []
+    iterative = solve_for_x(octree.leaf_nodes, octree.neighbours,
+                            solver='minres', tol=1e-10,
+                            residuals=residuals)
+    assert residuals[-1] <= 1e-10
+    np.testing.assert_allclose(iterative, direct,
+                               atol=1e-5 * abs(direct).max())
+    for options in ({'solver': 'cg'},
+                    {'solver': 'minres', 'preconditioner': 'ichol'}):
+        with pytest.raises(ValueError, match='indefinite'):
+            solve_for_x(octree.leaf_nodes, octree.neighbours, **options)
+
+
+def test_indicator_batch_and_grid():
+    octree = Octree(sphere_points(1000), 4, max_points=30)
+    x_vec = solve_for_x(octree.leaf_nodes)
+    rng = np.random.default_rng(2)
+    points = rng.uniform(-1.2, 1.2, size=(50, 3))
+    expected = [indicator(*p, x_vec, octree.leaf_nodes) for p in points]
+    np.testing.assert_allclose(
+        indicator_batch(points, x_vec, octree.leaf_nodes), expected,
+        rtol=1e-10, atol=1e-12 * np.abs(expected).max())
+
+    bounds = ((-1.1, -1.2, -1.0), (1.2, 1.0, 1.1))
+    res = (9, 8, 7)
+    lo, spacing, n = grid_axes(bounds, res)
+    nodes = lo + np.indices(n).reshape(3, -1).T * spacing
+    volume = indicator_grid(bounds, res, x_vec, octree.leaf_nodes)
+    assert volume.shape == res
+    expected = indicator_batch(nodes, x_vec, octree.leaf_nodes)
+    np.testing.assert_allclose(volume.ravel(), expected, rtol=1e-10,
+                               atol=1e-12 * np.abs(expected).max())
+
+
+def test_streaming_voxel_downsample():
+    points = sphere_points(5000)
+    cell_size = 0.1
+    chunks = [(points.positions[s:s+700], points.normals[s:s+700])
+              for s in range(0, len(points), 700)]
+    lo = points.positions.min(axis=0)
+    result = streaming_voxel_downsample(iter(chunks), cell_size, lo)
+    expected = points.voxel_downsample(cell_size)
+    assert len(result) == len(expected)
+    order = np.lexsort(result.positions.T)
+    expected_order = np.lexsort(expected.positions.T)
+    np.testing.assert_allclose(result.positions[order],
+                               expected.positions[expected_order],
+                               atol=1e-12)
+    np.testing.assert_allclose(result.normals[order],
+                               expected.normals[expected_order],
+                               atol=1e-12)
@@ -0,0 +1,61 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from johnvm.util_io import (
+    write_pcb, append_pcb, open_pcb, read_pcb_header, npts_to_pcb,
+    iter_chunks, chunk_bbox,
+)
+
+
+def random_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, 6)) * 1e3 + 1e5
+
+
+def test_pcb_round_trip(tmp_path):
+    records = random_records(1000)
+    path = str(tmp_path / 'points.pcb')
+    write_pcb(path, records[:600, :3], records[:600, 3:])
+    append_pcb(path, records[600:, :3], records[600:, 3:])
+    dtype, count = read_pcb_header(path)
+    assert dtype == np.float64 and count == 1000
+    # float64 by default: no loss
+    np.testing.assert_array_equal(open_pcb(path), records)
+    positions = np.concatenate([p for p, _ in iter_chunks(path, 300)])
+    np.testing.assert_array_equal(positions, records[:, :3])
+    lo, hi = chunk_bbox(iter_chunks(path, 300))
+    np.testing.assert_array_equal(lo, records[:, :3].min(axis=0))
+    np.testing.assert_array_equal(hi, records[:, :3].max(axis=0))
+
+
+def test_npts_to_pcb(tmp_path):
+    records = random_records(250)
+    npts = str(tmp_path / 'points.npts')
+    pcb = str(tmp_path / 'points.pcb')
+    np.savetxt(npts, records, fmt='%.17g')
+    assert npts_to_pcb(npts, pcb, chunk_size=100) == 250
+    np.testing.assert_array_equal(open_pcb(pcb), records)
+
+    np.savetxt(npts, records[:, :5], fmt='%.17g')
+    with pytest.raises(ValueError, match='columns'):
+        npts_to_pcb(npts, pcb)
+
+
+def test_xyz_colors_warning(tmp_path):
+    rng = np.random.default_rng(0)
+    positions = rng.normal(size=(50, 3))
+    normals = positions / np.linalg.norm(positions, axis=1)[:, np.newaxis]
+    colors = rng.integers(0, 256, size=(50, 3))
+    path = str(tmp_path / 'points.xyz')
+
+    np.savetxt(path, np.column_stack((positions, normals)))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        list(iter_chunks(path, 20))
+
+    np.savetxt(path, np.column_stack((positions, colors)))
+    with pytest.warns(UserWarning, match='RGB') as record:
+        list(iter_chunks(path, 20))
+    assert len(record) == 1